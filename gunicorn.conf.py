@@ -0,0 +1,27 @@
+import os
+
+
+# Sync workers by default: against SQLite the load test serves fewer
+# requests per second with threads (see the README). Threads should help
+# when requests wait on a remote database or on the JWKS fetch, but are
+# only worth turning on once a run against PostgreSQL shows it.
+# GUNICORN_THREADS should not exceed DB_POOL_SIZE + DB_MAX_OVERFLOW.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# The app is loaded once by the master and the workers share its memory
+# copy-on-write. Loading it opens no database connection, and each worker
+# drops the pooled connections it inherited anyway.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from database.models import dispose_engines
+        dispose_engines(server.app.wsgi())
+
+        # The master ran create_app once, the first worker reports it
+        if worker.age > 1:
+            from metrics.hooks import forget_inherited_startup
+            forget_inherited_startup()
@@ -0,0 +1,111 @@
+import os
+from flask import abort
+
+from database.models import bulk_insert, bulk_update, bulk_delete
+from .validation import validate_records
+
+
+MAX_BULK_SIZE = int(os.environ.get('MAX_BULK_SIZE', 1000))
+MAX_BULK_IDS = int(os.environ.get('MAX_BULK_IDS', 50000))
+
+
+def get_bulk_records(body):
+    '''
+    get_bulk_records(body)
+    Checks that the request body is a JSON array of at most
+    MAX_BULK_SIZE records and returns it
+    '''
+    if type(body) is not list:
+        abort(400, description='Bad Request. Expected a JSON array.')
+
+    if len(body) > MAX_BULK_SIZE:
+        abort(400, description=(
+            f'Bad Request. At most {MAX_BULK_SIZE} records are allowed.'))
+
+    return body
+
+
+def get_bulk_ids(body):
+    '''
+    get_bulk_ids(body)
+    Returns the `ids` list of the request body without duplicates.
+    It should be a list of at most MAX_BULK_IDS integers
+    '''
+    ids = body.get('ids') if type(body) is dict else None
+
+    if (
+        type(ids) is not list
+        or any(type(item_id) is not int for item_id in ids)
+    ):
+        abort(400, description='Bad Request. Expected a list of integer ids.')
+
+    if len(ids) > MAX_BULK_IDS:
+        abort(400, description=(
+            f'Bad Request. At most {MAX_BULK_IDS} ids are allowed.'))
+
+    return list(dict.fromkeys(ids))
+
+
+def get_bulk_patch(body, validate_patch):
+    '''
+    get_bulk_patch(body, validate_patch)
+    Returns the validated column values of the request body `patch`
+    '''
+    values, error = validate_patch(body.get('patch'))
+
+    if error is not None:
+        status_code, description = error
+        abort(status_code, description=description)
+
+    if not values:
+        abort(400, description='Bad Request. Nothing to update.')
+
+    return values
+
+
+def update_bulk(model, ids, values):
+    '''
+    update_bulk(model, ids, values)
+    Returns the (updated_ids, not_found_ids) of a bulk update
+    '''
+    updated_ids = bulk_update(model, ids, values) if ids else []
+    updated = set(updated_ids)
+    not_found_ids = [item_id for item_id in ids if item_id not in updated]
+    return sorted(updated), not_found_ids
+
+
+def delete_bulk(model, ids):
+    '''
+    delete_bulk(model, ids)
+    Returns the (deleted_ids, not_found_ids) of a bulk delete
+    '''
+    deleted_ids = bulk_delete(model, ids) if ids else []
+    deleted = set(deleted_ids)
+    not_found_ids = [item_id for item_id in ids if item_id not in deleted]
+    return sorted(deleted), not_found_ids
+
+
+def create_bulk(model, records, validate):
+    '''
+    create_bulk(model, records, validate)
+    Validates the whole batch in one pass, then inserts the valid
+    records in a single transaction.
+    Returns one result per record, in order, holding either the
+    created id or the validation error
+    '''
+    results = [None] * len(records)
+    valid, invalid = validate_records(validate, records)
+
+    for index, (status_code, description) in invalid:
+        results[index] = {
+            'index': index,
+            'error': status_code,
+            'description': description
+        }
+
+    if valid:
+        ids = bulk_insert(model, [values for _, values in valid])
+        for (index, _), created_id in zip(valid, ids):
+            results[index] = {'index': index, 'id': created_id}
+
+    return results
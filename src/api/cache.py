@@ -0,0 +1,283 @@
+import os
+import hashlib
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlparse
+from flask import current_app, g, make_response, _request_ctx_stack
+
+from metrics.hooks import REGISTRY
+from .etag import table_etag
+
+
+logger = logging.getLogger(__name__)
+
+# none, lru or memcached
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'none')
+# memcached://host:port of the shared cache
+RESPONSE_CACHE_URL = os.environ.get(
+    'RESPONSE_CACHE_URL', 'memcached://127.0.0.1:11211')
+# Seconds an entry is kept. Entries are never stale, since their key holds
+# the versions of the tables they read, this only bounds their memory.
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+# Entries kept by the in-process LRU cache
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+# Seconds the shared cache is skipped after a connection error
+RESPONSE_CACHE_RETRY_INTERVAL = float(
+    os.environ.get('RESPONSE_CACHE_RETRY_INTERVAL', 5))
+
+
+class LRUCache:
+    '''
+    LRUCache
+    In-process least recently used cache, local to the worker process
+    '''
+
+    name = 'lru'
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=RESPONSE_CACHE_TTL):
+        # Entries can not become stale, so the LRU order bounds them
+        evicted = 0
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+
+        if evicted:
+            REGISTRY.inc('response_cache_evictions_total', {}, evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'evictions': self.evictions
+            }
+
+
+class MemcachedCache:
+    '''
+    MemcachedCache
+    Cache shared by the workers, on a memcached server spoken to with the
+    text protocol over one connection per thread.
+    Errors are logged and treated as misses, the cache never fails a request.
+    After a connection error the server is skipped for retry_interval
+    seconds, so an unreachable server does not add its timeout to every
+    request.
+    '''
+
+    name = 'memcached'
+
+    def __init__(self, url=RESPONSE_CACHE_URL, timeout=0.5,
+                 retry_interval=RESPONSE_CACHE_RETRY_INTERVAL):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 11211)
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._down_until = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = socket.create_connection(self.address, self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = (sock, sock.makefile('rb'))
+            self._local.connection = connection
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection[1].close()
+            connection[0].close()
+
+    def _fail(self, error):
+        logger.warning('Response cache unavailable: %s', error)
+        self._close()
+        self._down_until = time.monotonic() + self.retry_interval
+
+    def _readline(self, reader):
+        # An empty read means the server closed the connection
+        line = reader.readline()
+        if not line:
+            self._close()
+        return line
+
+    def _call(self, command, payload=None):
+        if time.monotonic() < self._down_until:
+            return None
+
+        try:
+            sock, reader = self._connection()
+            data = command.encode('ascii') + b'\r\n'
+            if payload is not None:
+                data += payload + b'\r\n'
+            sock.sendall(data)
+            return reader
+        except OSError as error:
+            self._fail(error)
+            return None
+
+    def get(self, key):
+        reader = self._call(f'get {key}')
+        if reader is None:
+            return None
+
+        try:
+            line = self._readline(reader)
+            if not line.startswith(b'VALUE '):
+                return None
+
+            length = int(line.split()[3])
+            value = reader.read(length + 2)[:-2]
+            self._readline(reader)  # END
+            return value
+        except OSError as error:
+            self._fail(error)
+            return None
+        except (ValueError, IndexError) as error:
+            logger.warning('Unexpected response cache reply: %s', error)
+            self._close()
+            return None
+
+    def set(self, key, value, ttl=RESPONSE_CACHE_TTL):
+        reader = self._call(f'set {key} 0 {ttl} {len(value)}', value)
+        if reader is None:
+            return
+
+        try:
+            self._readline(reader)  # STORED
+        except OSError as error:
+            self._fail(error)
+
+    def stats(self):
+        stats = {'backend': self.name}
+        reader = self._call('stats')
+        if reader is None:
+            return stats
+
+        try:
+            for line in iter(lambda: self._readline(reader), b'END\r\n'):
+                if not line.startswith(b'STAT '):
+                    break
+                _, name, value = line.decode('ascii').split(' ', 2)
+                if name in ('curr_items', 'evictions', 'get_hits',
+                            'get_misses', 'bytes', 'limit_maxbytes'):
+                    stats[name] = int(value)
+        except OSError as error:
+            self._fail(error)
+        except ValueError as error:
+            logger.warning('Unexpected response cache reply: %s', error)
+            self._close()
+
+        return stats
+
+
+def get_response_cache(name=RESPONSE_CACHE):
+    '''
+    get_response_cache(name=RESPONSE_CACHE)
+    Returns the response cache backend for name: none, lru or memcached
+    '''
+    if name == 'none':
+        return None
+    if name == 'lru':
+        return LRUCache()
+    if name == 'memcached':
+        return MemcachedCache()
+
+    raise ValueError(f'Unknown RESPONSE_CACHE {name!r}.')
+
+
+def setup_response_cache(app, name=RESPONSE_CACHE):
+    '''
+    setup_response_cache(app, name=RESPONSE_CACHE)
+    Sets the response cache backend used by @cached for app
+    '''
+    app.extensions['response_cache'] = get_response_cache(name)
+
+
+def permission_scope():
+    '''
+    permission_scope()
+    Returns the sorted permissions of the authenticated request
+    '''
+    payload = getattr(_request_ctx_stack.top, 'current_user', None) or {}
+    return ','.join(sorted(payload.get('permissions', [])))
+
+
+def cache_key(*models):
+    '''
+    cache_key(*models)
+    Returns the cache key of the current request, made of its ETag (route,
+    query string and versions of the tables it reads) and the permission
+    scope of its token. A write bumps the version of its table, so the
+    entries of every response that read it can not be hit again.
+    '''
+    etag = g.get('etag') or table_etag(*models)
+    scope = permission_scope()
+
+    return 'response:' + hashlib.sha1(
+        f'{etag}|{scope}'.encode()).hexdigest()
+
+
+def cached(*models):
+    '''
+    @cached(*models) decorator
+        it should return the cached body of the request if there is one
+            without calling the decorated method
+        it should cache the successful, not streamed responses otherwise
+        it should do nothing if the app has no response cache
+    '''
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None:
+                return f(*args, **kwargs)
+
+            key = cache_key(*models)
+            value = cache.get(key)
+
+            if value is not None:
+                REGISTRY.inc('response_cache_requests_total', {
+                    'backend': cache.name, 'result': 'hit'})
+                mimetype, _, body = value.partition(b'\n')
+                return current_app.response_class(
+                    body, mimetype=mimetype.decode('ascii'))
+
+            REGISTRY.inc('response_cache_requests_total', {
+                'backend': cache.name, 'result': 'miss'})
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.set(
+                    key,
+                    response.mimetype.encode('ascii') + b'\n'
+                    + response.get_data())
+
+            return response
+
+        return wrapper
+    return cached_decorator
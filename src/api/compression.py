@@ -0,0 +1,181 @@
+import os
+import zlib
+from flask import request
+
+from metrics.hooks import timed_phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3))
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/csv')
+
+
+class GzipCompressor:
+    def __init__(self, level=COMPRESSION_GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality=COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level=COMPRESSION_ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(
+            level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    '''
+    available_encodings()
+    Returns the supported content codings, preferred first.
+    brotli and zstd are used only when their packages are installed.
+    '''
+    encodings = {}
+
+    if zstandard is not None:
+        encodings['zstd'] = ZstdCompressor
+    if brotli is not None:
+        encodings['br'] = BrotliCompressor
+    encodings['gzip'] = GzipCompressor
+
+    return encodings
+
+
+def choose_encoding(accept_encodings, encodings):
+    '''
+    choose_encoding(accept_encodings, encodings)
+    Returns the encoding with the highest quality in Accept-Encoding,
+    ties going to the server preference, or None
+    '''
+    return accept_encodings.best_match(list(encodings))
+
+
+def compress_stream(chunks, compressor):
+    '''
+    compress_stream(chunks, compressor)
+    Compresses a streamed body chunk by chunk, flushing after each chunk
+    so the client keeps receiving data as it is produced
+    '''
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+
+    yield compressor.finish()
+
+
+class Compression:
+    '''
+    Compression
+    Compresses the successful responses of an app according to the
+    Accept-Encoding of the request
+    '''
+
+    def __init__(self, min_size=COMPRESSION_MIN_SIZE):
+        self.min_size = min_size
+        self.encodings = available_encodings()
+
+    def should_compress(self, response):
+        return (
+            response.status_code == 200
+            and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and 'Content-Encoding' not in response.headers
+            and not response.direct_passthrough
+        )
+
+    def after_request(self, response):
+        if not self.should_compress(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        if (
+            not response.is_streamed
+            and len(response.get_data()) < self.min_size
+        ):
+            return response
+
+        encoding = choose_encoding(request.accept_encodings, self.encodings)
+        if encoding is None:
+            return response
+
+        compressor = self.encodings[encoding]()
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, compressor)
+            response.headers.pop('Content-Length', None)
+        else:
+            with timed_phase('compression'):
+                response.set_data(
+                    compressor.compress(response.get_data())
+                    + compressor.finish())
+
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed body is a different representation of the
+        # same resource, so it may only carry a weak validator
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+
+def setup_compression(app, min_size=COMPRESSION_MIN_SIZE):
+    '''
+    setup_compression(app, min_size=COMPRESSION_MIN_SIZE)
+    Compresses the responses of app of at least min_size bytes,
+    and every streamed response
+    '''
+    compression = Compression(min_size)
+    app.extensions['compression'] = compression
+    app.after_request(compression.after_request)
+
+    return compression
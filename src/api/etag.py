@@ -0,0 +1,58 @@
+import hashlib
+from functools import wraps
+from flask import g, request, make_response, Response
+
+from database.models import get_table_versions
+from .include import included_models
+
+
+def table_etag(*models):
+    '''
+    table_etag(*models)
+    Builds a strong ETag for the current request from the versions of the
+    tables it reads and its path and query string.
+    The versions are read before the data, so a write that lands between
+    the two can only make the ETag older than the body, never newer.
+    '''
+    table_names = [model.__tablename__ for model in models]
+    versions = get_table_versions(*table_names)
+
+    key = '|'.join([
+        request.path,
+        request.query_string.decode('latin-1'),
+        ','.join(f'{name}:{version}' for name, version
+                 in zip(table_names, versions))
+    ])
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(*models, includes=None):
+    '''
+    @conditional(*models, includes=None) decorator
+        it should build the ETag of the request with table_etag
+            over models and the models of the relations it includes
+        it should return a 304 Not Modified if it matches If-None-Match
+            without calling the decorated method
+        it should set the ETag header on successful responses otherwise
+        it should keep the ETag in g.etag for the decorated method
+    '''
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = g.etag = table_etag(
+                *models, *included_models(includes or {}, request.args))
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+
+            return response
+
+        return wrapper
+    return conditional_decorator
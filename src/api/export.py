@@ -0,0 +1,225 @@
+import os
+import csv
+import io
+import queue
+import threading
+from flask import Response, abort, stream_with_context
+
+from database.models import db
+from .filters import integer
+from .json_provider import dumps
+from .streaming import STREAM_BATCH_SIZE, stream_rows
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Bytes of COPY output sent to the client at once
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 64 * 1024))
+# Chunks a COPY can read ahead of a slow client before it waits for it
+EXPORT_QUEUE_SIZE = int(os.environ.get('EXPORT_QUEUE_SIZE', 16))
+
+
+def parse_export(args):
+    '''
+    parse_export(args)
+    Returns the format and the since id of an export request,
+    e.g. ?format=csv&since=1000
+    '''
+    export_format = args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=(
+            'Bad Request. format must be one of: '
+            + ', '.join(EXPORT_FORMATS) + '.'))
+
+    since = args.get('since')
+    if since is not None:
+        try:
+            since = integer(since)
+        except ValueError:
+            abort(400, description='Bad Request. Invalid since.')
+
+    return export_format, since
+
+
+def export_query(model, since=None):
+    '''
+    export_query(model, since=None)
+    Returns the query selecting every column of the records of model
+    with an id greater than since, in id order
+    '''
+    query = db.session.query(
+        *[getattr(model, field) for field in model.FIELDS])
+    if since is not None:
+        query = query.filter(model.id > since)
+
+    return query.order_by(model.id)
+
+
+class ExportCancelled(Exception):
+    '''
+    ExportCancelled Exception
+    Raised in the COPY of an export whose client went away
+    '''
+    pass
+
+
+class CopyPipe:
+    '''
+    CopyPipe
+    File object receiving the output of a COPY ... TO STDOUT in a thread,
+    handed to the response in chunks of EXPORT_CHUNK_SIZE bytes.
+    At most queue_size chunks wait for the client, so a slow client
+    slows the COPY down instead of growing the memory of the worker.
+    '''
+
+    def __init__(self, chunk_size, queue_size):
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(queue_size)
+        self.cancelled = threading.Event()
+        self.buffer = bytearray()
+
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+        raise ExportCancelled()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer = bytearray()
+
+
+def copy_to_stdout(connection, statement, chunk_size=EXPORT_CHUNK_SIZE,
+                   queue_size=EXPORT_QUEUE_SIZE):
+    '''
+    copy_to_stdout(connection, statement)
+    Yields the output of a PostgreSQL COPY ... TO STDOUT statement
+    while the server writes it
+    '''
+    pipe = CopyPipe(chunk_size, queue_size)
+    errors = []
+
+    def copy():
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, pipe)
+            pipe.flush()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            cursor.close()
+            try:
+                pipe.put(None)
+            except ExportCancelled:
+                pass
+
+    thread = threading.Thread(target=copy, name='export-copy', daemon=True)
+    thread.start()
+
+    try:
+        for chunk in iter(pipe.chunks.get, None):
+            yield chunk
+    finally:
+        pipe.cancelled.set()
+        thread.join()
+
+        if errors or not pipe.chunks.empty():
+            # A COPY stopped halfway leaves its connection unusable
+            connection.invalidate()
+
+    if errors:
+        raise errors[0]
+
+
+def copy_csv(connection, query):
+    '''
+    copy_csv(connection, query)
+    Streams the results of query as CSV with COPY ... TO STDOUT
+    '''
+    select = query.statement.compile(
+        dialect=connection.dialect,
+        compile_kwargs={'literal_binds': True})
+    statement = f'COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)'
+
+    return copy_to_stdout(connection, statement)
+
+
+def write_csv(fields, rows, batch_size=STREAM_BATCH_SIZE):
+    '''
+    write_csv(fields, rows)
+    Yields the rows as CSV, in chunks of batch_size rows,
+    as COPY ... WITH (FORMAT csv, HEADER) writes them
+    '''
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(fields)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+
+    yield output.getvalue().encode('utf-8')
+
+
+def write_ndjson(fields, rows, batch_size=STREAM_BATCH_SIZE):
+    '''
+    write_ndjson(fields, rows)
+    Yields the rows as JSON objects, one per line,
+    in chunks of batch_size rows
+    '''
+    chunk = []
+    for row in rows:
+        chunk.append(dumps(dict(zip(fields, row))))
+        chunk.append(b'\n')
+
+        if len(chunk) >= 2 * batch_size:
+            yield b''.join(chunk)
+            chunk = []
+
+    yield b''.join(chunk)
+
+
+def export_response(model, export_format, since=None):
+    '''
+    export_response(model, export_format, since=None)
+    Returns a response streaming the records of model in export_format.
+    CSV on PostgreSQL is written by the server with COPY, everything else
+    is read through a server side cursor, so the memory used stays the
+    same whatever the size of the table.
+    '''
+    query = export_query(model, since)
+
+    def generate():
+        connection = db.session.connection()
+
+        if export_format == 'csv' and connection.dialect.name == 'postgresql':
+            yield from copy_csv(connection, query)
+        elif export_format == 'csv':
+            yield from write_csv(model.FIELDS, stream_rows(query))
+        else:
+            yield from write_ndjson(model.FIELDS, stream_rows(query))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename={model.__tablename__.lower()}s.'
+                + export_format)
+        })
@@ -0,0 +1,52 @@
+import operator
+from flask import abort
+
+from database.models import Actor, Movie
+from .validation import in_integer_range
+
+
+def integer(value):
+    '''
+    integer(value)
+    Parses the value of a filter on an Integer column.
+    Raises a ValueError if it is out of the range of the column.
+    '''
+    value = int(value)
+    if not in_integer_range(value):
+        raise ValueError(f'{value} is out of range.')
+
+    return value
+
+
+# Query argument: (column, comparison, type of the value)
+ACTOR_FILTERS = {
+    'gender': (Actor.gender, operator.eq, str),
+    'min_age': (Actor.age, operator.ge, integer),
+    'max_age': (Actor.age, operator.le, integer)
+}
+
+MOVIE_FILTERS = {
+    'release_year_from': (Movie.release_year, operator.ge, integer),
+    'release_year_to': (Movie.release_year, operator.le, integer)
+}
+
+
+def apply_filters(query, filters, args):
+    '''
+    apply_filters(query, filters, args)
+    Adds a SQL predicate to the query for every filter present
+    in the request arguments, i.e. ?gender=Female&min_age=30
+    '''
+    for name, (column, compare, value_type) in filters.items():
+        value = args.get(name)
+        if value is None:
+            continue
+
+        try:
+            value = value_type(value)
+        except ValueError:
+            abort(400, description=f'Bad Request. Invalid {name}.')
+
+        query = query.filter(compare(column, value))
+
+    return query
@@ -0,0 +1,233 @@
+import os
+import csv
+import io
+import json
+from itertools import islice
+from flask import abort
+from sqlalchemy import exc, insert, text
+
+from database.models import db, bump_table_version
+from .export import EXPORT_FORMATS
+from .validation import validate_records
+
+
+# Records validated and loaded at once
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 10000))
+# Invalid records listed in the response of an import
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 100))
+
+IMPORT_FORMATS = EXPORT_FORMATS
+
+
+def get_import_format(name, mimetype=None):
+    '''
+    get_import_format(name, mimetype=None)
+    Returns the import format named name (csv or ndjson), or the one
+    of mimetype if name is None. Returns None if neither is known.
+    '''
+    if name is None:
+        name = next((
+            import_format
+            for import_format, import_mimetype in IMPORT_FORMATS.items()
+            if import_mimetype == mimetype
+        ), None)
+
+    name = name.lower() if name else None
+    return name if name in IMPORT_FORMATS else None
+
+
+def parse_import_format(args, mimetype):
+    '''
+    parse_import_format(args, mimetype)
+    Returns the format of an import request body, given by the format
+    argument or else by the Content-Type
+    '''
+    import_format = get_import_format(args.get('format'), mimetype)
+    if import_format is None:
+        abort(400, description=(
+            'Bad Request. Expected a CSV or NDJSON body.'))
+
+    return import_format
+
+
+def read_records(stream, import_format):
+    '''
+    read_records(stream, import_format)
+    Yields the (line, record) pairs of a binary CSV or NDJSON stream.
+    CSV values are strings, coerced by the validation like JSON strings.
+    NDJSON lines that are not JSON are yielded as their text.
+    Raises a UnicodeDecodeError if the stream is not UTF-8.
+    '''
+    lines = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    if import_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line, text_line in enumerate(lines, 1):
+        if not text_line.strip():
+            continue
+        try:
+            yield line, json.loads(text_line)
+        except ValueError:
+            yield line, text_line.rstrip('\r\n')
+
+
+class ImportReport:
+    '''
+    ImportReport
+    Counts the imported and invalid records of an import and keeps the
+    first max_errors errors. Every error is also written as a JSON line
+    to error_file, if given.
+    '''
+
+    def __init__(self, max_errors=IMPORT_MAX_ERRORS, error_file=None):
+        self.imported = 0
+        self.invalid = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.error_file = error_file
+
+    def add_error(self, line, record, error):
+        status_code, description = error
+        entry = {
+            'line': line,
+            'error': status_code,
+            'description': description
+        }
+
+        self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(entry)
+
+        if self.error_file is not None:
+            self.error_file.write(
+                json.dumps(dict(entry, record=record), default=str) + '\n')
+
+    def format(self):
+        return {
+            'imported_count': self.imported,
+            'invalid_count': self.invalid,
+            'errors': self.errors
+        }
+
+
+class InsertLoader:
+    '''
+    InsertLoader
+    Loads the records of an import with executemany INSERT statements
+    '''
+
+    def __init__(self, connection, model):
+        self.connection = connection
+        self.table = model.__table__
+
+    def load(self, rows):
+        self.connection.execute(insert(self.table), rows)
+
+    def merge(self):
+        pass
+
+
+class CopyLoader:
+    '''
+    CopyLoader
+    Loads the records of an import into a temporary staging table with
+    COPY ... FROM STDIN, then merges the staging table into the table of
+    model with a single INSERT ... SELECT, in the order of the records.
+    PostgreSQL only.
+    '''
+
+    def __init__(self, connection, model):
+        self.connection = connection
+        self.columns = [field for field in model.FIELDS if field != 'id']
+        self.lines = 0
+
+        quote = connection.dialect.identifier_preparer.quote
+        self.table = quote(model.__tablename__)
+        self.staging = quote(f'import_{model.__tablename__}')
+        self.column_list = ', '.join(quote(column) for column in self.columns)
+
+        connection.execute(text(
+            f'CREATE TEMPORARY TABLE {self.staging} ON COMMIT DROP AS '
+            f'SELECT 0 AS import_line, {self.column_list} '
+            f'FROM {self.table} WITH NO DATA'))
+
+    def load(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in rows:
+            self.lines += 1
+            writer.writerow(
+                [self.lines] + [row[column] for column in self.columns])
+        buffer.seek(0)
+
+        statement = (
+            f'COPY {self.staging} (import_line, {self.column_list}) '
+            'FROM STDIN WITH (FORMAT csv)')
+        dbapi_error = self.connection.dialect.dbapi.Error
+
+        # The cursor bypasses SQLAlchemy, which would wrap its errors
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        except dbapi_error as error:
+            raise exc.DBAPIError.instance(
+                statement, None, error, dbapi_error) from error
+        finally:
+            cursor.close()
+
+    def merge(self):
+        self.connection.execute(text(
+            f'INSERT INTO {self.table} ({self.column_list}) '
+            f'SELECT {self.column_list} FROM {self.staging} '
+            'ORDER BY import_line'))
+
+
+def import_records(model, records, validate, report=None,
+                   chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+    import_records(model, records, validate, report=None)
+    Validates the (line, record) pairs with the create rules in chunks of
+    chunk_size, and loads the valid ones in a single transaction:
+    with COPY and a staging table on PostgreSQL, with executemany INSERT
+    statements elsewhere. Invalid records are added to the report.
+    Returns the report. Raises a SQLAlchemyError, after a rollback, if
+    the records cannot be loaded.
+    '''
+    if report is None:
+        report = ImportReport()
+
+    connection = db.session.connection()
+    loader_class = (
+        CopyLoader if connection.dialect.name == 'postgresql'
+        else InsertLoader)
+
+    try:
+        loader = loader_class(connection, model)
+        records = iter(records)
+
+        for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+            valid, invalid = validate_records(
+                validate, [record for _, record in chunk])
+            rows = [values for _, values in valid]
+
+            for index, error in invalid:
+                line, record = chunk[index]
+                report.add_error(line, record, error)
+
+            if rows:
+                loader.load(rows)
+                report.imported += len(rows)
+
+        if report.imported:
+            loader.merge()
+            bump_table_version(model.__tablename__)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return report
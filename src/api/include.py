@@ -0,0 +1,91 @@
+from collections import namedtuple
+from flask import abort
+
+from database.models import db, Actor, Movie, Cast
+
+
+# Ids per SELECT ... WHERE id IN (...) statement, like selectinload
+INCLUDE_BATCH_SIZE = 500
+
+# A list of related records: their model, the Cast column holding the id of
+# the record they are attached to and the Cast column holding their own id
+Relation = namedtuple('Relation', ['model', 'key', 'related_key'])
+
+MOVIE_INCLUDES = {
+    'actors': Relation(Actor, Cast.movie_id, Cast.actor_id)
+}
+
+ACTOR_INCLUDES = {
+    'movies': Relation(Movie, Cast.actor_id, Cast.movie_id)
+}
+
+
+def parse_include(includes, args):
+    '''
+    parse_include(includes, args)
+    Returns the relations requested by the `include` argument
+    (i.e. include=actors), in includes order
+    '''
+    include = args.get('include')
+    if include is None:
+        return ()
+
+    requested = set(name.strip() for name in include.split(','))
+    requested.discard('')
+
+    if not requested.issubset(includes):
+        abort(400, description='Bad Request. Unknown include requested.')
+
+    return tuple(name for name in includes if name in requested)
+
+
+def included_models(includes, args):
+    '''
+    included_models(includes, args)
+    Returns the models read by the relations requested in args
+    '''
+    names = parse_include(includes, args)
+    if not names:
+        return []
+
+    return [Cast] + [includes[name].model for name in names]
+
+
+def load_related(relation, ids):
+    '''
+    load_related(relation, ids)
+    Returns the formatted related records of every id, in a dict by id.
+    They are read with one SELECT per INCLUDE_BATCH_SIZE ids, so their
+    cost does not grow with the number of records.
+    '''
+    model = relation.model
+    columns = [getattr(model, field) for field in model.FIELDS]
+    related = {record_id: [] for record_id in ids}
+
+    for start in range(0, len(ids), INCLUDE_BATCH_SIZE):
+        rows = (
+            db.session.query(relation.key, *columns)
+            .join(model, model.id == relation.related_key)
+            .filter(relation.key.in_(ids[start:start + INCLUDE_BATCH_SIZE]))
+            .order_by(relation.key, model.id))
+
+        for row in rows:
+            related[row[0]].append(dict(zip(model.FIELDS, row[1:])))
+
+    return related
+
+
+def include_related(records, includes, names):
+    '''
+    include_related(records, includes, names)
+    Adds the related records of every relation in names
+    to the formatted records, under the name of the relation
+    '''
+    ids = [record['id'] for record in records]
+
+    for name in names:
+        related = load_related(includes[name], ids)
+        for record in records:
+            record[name] = related[record['id']]
+
+    return records
@@ -0,0 +1,94 @@
+import os
+from flask import current_app, json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# auto uses orjson when it is installed, stdlib always uses the json module
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+
+
+class StdlibJSONProvider:
+    '''
+    StdlibJSONProvider
+    Encodes compact JSON with flask.json, exactly as jsonify does
+    '''
+
+    name = 'stdlib'
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonJSONProvider(StdlibJSONProvider):
+    '''
+    OrjsonJSONProvider
+    Encodes compact JSON with orjson, byte for byte like the stdlib provider.
+    Documents orjson would encode differently fall back to the stdlib:
+        non ASCII output (the stdlib escapes it as \\uXXXX),
+        types orjson does not support (i.e. integers over 64 bits)
+    Dates and dataclasses are passed to the app's JSONEncoder.
+    '''
+
+    name = 'orjson'
+
+    def dumps(self, obj):
+        try:
+            data = orjson.dumps(
+                obj,
+                default=current_app.json_encoder().default,
+                option=self._options())
+        except TypeError:
+            return super().dumps(obj)
+
+        if not data.isascii():
+            return super().dumps(obj)
+
+        return data
+
+    def _options(self):
+        options = (
+            orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+        if current_app.config['JSON_SORT_KEYS']:
+            options |= orjson.OPT_SORT_KEYS
+
+        return options
+
+
+def get_json_provider(name=JSON_ENCODER):
+    '''
+    get_json_provider(name=JSON_ENCODER)
+    Returns the JSON provider for name: auto, orjson or stdlib
+    '''
+    if name == 'stdlib' or (name == 'auto' and orjson is None):
+        return StdlibJSONProvider()
+
+    if orjson is None:
+        raise RuntimeError('JSON_ENCODER is orjson but it is not installed.')
+
+    return OrjsonJSONProvider()
+
+
+def setup_json_provider(app, name=JSON_ENCODER):
+    '''
+    setup_json_provider(app, name=JSON_ENCODER)
+    Sets the JSON provider used by api.responses.jsonify for app
+    '''
+    app.extensions['json_provider'] = get_json_provider(name)
+
+
+def dumps(obj):
+    '''
+    dumps(obj)
+    Encodes obj as compact JSON bytes with the provider of the current app
+    '''
+    provider = current_app.extensions.get('json_provider')
+    if provider is None:
+        provider = StdlibJSONProvider()
+
+    return provider.dumps(obj)
@@ -0,0 +1,123 @@
+import os
+import json
+import base64
+import binascii
+from collections import namedtuple
+from flask import abort
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+Sort = namedtuple('Sort', ['sort', 'key', 'descending'])
+
+
+def encode_cursor(sort, value, last_id):
+    '''
+    encode_cursor(sort, value, last_id)
+    Builds an opaque cursor pointing after the given row
+    '''
+    raw = json.dumps([sort, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    '''
+    decode_cursor(cursor, sort)
+    Returns the (value, last_id) stored in a cursor made by encode_cursor
+    '''
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        abort(400, description='Bad Request. Invalid cursor.')
+
+    if (
+        cursor_sort != sort
+        or type(last_id) is not int
+        or type(value) not in (int, str)
+    ):
+        abort(400, description='Bad Request. Cursor does not match sort.')
+
+    return value, last_id
+
+
+def parse_limit(limit):
+    '''
+    parse_limit(limit)
+    Returns the requested page size, capped at MAX_PAGE_SIZE
+    '''
+    if limit is None:
+        return min(DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400, description='Bad Request. Limit must be an integer.')
+
+    if limit <= 0:
+        abort(400, description='Bad Request. Limit must be positive.')
+
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_sort(model, args):
+    '''
+    parse_sort(model, args)
+    Returns the Sort(sort, key, descending) requested by the `sort` argument.
+    Sorting is only allowed on the indexed model.SORT_KEYS,
+    a leading '-' sorts in descending order.
+    '''
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    key = sort[1:] if descending else sort
+
+    if key not in model.SORT_KEYS:
+        abort(400, description='Bad Request. Unsupported sort key.')
+
+    return Sort(sort, key, descending)
+
+
+def paginate(query, model, args, sort):
+    '''
+    paginate(query, model, args, sort)
+    Applies keyset pagination to a query using the request arguments
+    `limit` and `cursor`, and the Sort returned by parse_sort.
+    The query rows must expose the id and the sort key as attributes.
+    Returns the page rows and the cursor of the next page (or None)
+    '''
+    limit = parse_limit(args.get('limit'))
+    sort, key, descending = sort
+    column = getattr(model, key)
+    cursor = args.get('cursor')
+
+    if cursor is not None:
+        value, last_id = decode_cursor(cursor, sort)
+
+        if key == 'id':
+            position = model.id < last_id if descending else model.id > last_id
+        elif descending:
+            position = tuple_(column, model.id) < tuple_(value, last_id)
+        else:
+            position = tuple_(column, model.id) > tuple_(value, last_id)
+
+        query = query.filter(position)
+
+    if key == 'id':
+        order = [model.id.desc() if descending else model.id]
+    elif descending:
+        order = [column.desc(), model.id.desc()]
+    else:
+        order = [column, model.id]
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, key), last.id)
+
+    return rows, next_cursor
@@ -0,0 +1,53 @@
+from flask import abort
+
+from database.models import db
+
+
+def parse_fields(model, args):
+    '''
+    parse_fields(model, args)
+    Returns the fields requested by the `fields` argument
+    (i.e. fields=name,age), in model.FIELDS order.
+    The id is always included.
+    '''
+    fields = args.get('fields')
+    if fields is None:
+        return model.FIELDS
+
+    requested = set(field.strip() for field in fields.split(','))
+    requested.discard('')
+
+    if not requested.issubset(model.FIELDS):
+        abort(400, description='Bad Request. Unknown field requested.')
+
+    requested.add('id')
+    return tuple(field for field in model.FIELDS if field in requested)
+
+
+def project(model, fields, *extra_fields):
+    '''
+    project(model, fields, *extra_fields)
+    Returns a query selecting only the given columns as plain rows,
+    skipping the ORM instance hydration.
+    extra_fields (i.e. a sort key) are selected after fields.
+    '''
+    columns = [getattr(model, field) for field in fields]
+    columns.extend(
+        getattr(model, field)
+        for field in extra_fields
+        if field not in fields
+    )
+
+    return db.session.query(*columns)
+
+
+def format_row(row, fields):
+    '''
+    format_row(row, fields)
+    Builds the same dict as model.format() from a projected row
+    '''
+    return dict(zip(fields, row))
+
+
+def format_rows(rows, fields):
+    return [dict(zip(fields, row)) for row in rows]
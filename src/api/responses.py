@@ -0,0 +1,32 @@
+from flask import current_app, jsonify as flask_jsonify
+
+from metrics.hooks import timed_phase
+from .json_provider import dumps
+
+
+def jsonify(*args, **kwargs):
+    '''
+    jsonify(*args, **kwargs)
+    flask.jsonify encoding through the JSON provider of the app,
+    recorded as the serialization phase of the request.
+    Pretty printed responses are left to flask.jsonify.
+    '''
+    with timed_phase('serialization'):
+        if (
+            current_app.config['JSONIFY_PRETTYPRINT_REGULAR']
+            or current_app.debug
+        ):
+            return flask_jsonify(*args, **kwargs)
+
+        if args and kwargs:
+            raise TypeError(
+                'jsonify() behavior undefined when passed both args and '
+                'kwargs')
+        elif len(args) == 1:
+            data = args[0]
+        else:
+            data = args or kwargs
+
+        return current_app.response_class(
+            dumps(data) + b'\n',
+            mimetype=current_app.config['JSONIFY_MIMETYPE'])
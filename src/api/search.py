@@ -0,0 +1,46 @@
+import os
+from flask import abort
+
+from database.models import db
+from database.search import search_query
+from .projection import format_rows
+
+
+DEFAULT_SEARCH_LIMIT = int(os.environ.get('DEFAULT_SEARCH_LIMIT', 20))
+MAX_SEARCH_LIMIT = int(os.environ.get('MAX_SEARCH_LIMIT', 100))
+MIN_SEARCH_LENGTH = 3
+
+
+def parse_search(args):
+    '''
+    parse_search(args)
+    Returns the search text `q` and the result `limit` of the request,
+    the limit is capped at MAX_SEARCH_LIMIT
+    '''
+    search_text = args.get('q', '').strip()
+
+    if len(search_text) < MIN_SEARCH_LENGTH:
+        abort(422, description=(
+            f'Search text must be at least {MIN_SEARCH_LENGTH} characters.'))
+
+    try:
+        limit = int(args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        abort(400, description='Bad Request. Limit must be an integer.')
+
+    if limit <= 0:
+        abort(400, description='Bad Request. Limit must be positive.')
+
+    return search_text, min(limit, MAX_SEARCH_LIMIT)
+
+
+def search(model, column_name, search_text, limit):
+    '''
+    search(model, column_name, search_text, limit)
+    Returns the formatted rows of the best matches of search_text
+    '''
+    query = search_query(
+        model, column_name, model.FIELDS, search_text,
+        db.engine.dialect.name)
+
+    return format_rows(db.session.execute(query.limit(limit)), model.FIELDS)
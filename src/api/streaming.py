@@ -0,0 +1,53 @@
+import os
+from flask import Response, stream_with_context
+
+from .json_provider import dumps
+
+
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+
+
+def is_stream_requested(args):
+    '''
+    is_stream_requested(args)
+    Returns True if the request asked for a streamed response
+    '''
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_rows(query, batch_size=STREAM_BATCH_SIZE):
+    '''
+    stream_rows(query)
+    Iterates over the query results through a server side cursor,
+    holding at most batch_size rows in memory
+    '''
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def stream_json_list(key, rows, format_row, batch_size=STREAM_BATCH_SIZE):
+    '''
+    stream_json_list(key, rows, format_row)
+    Returns a response streaming the same document as
+        jsonify({"success": True, "status_code": 200, key: [...]})
+    with the list items written in chunks of batch_size rows
+    '''
+    def generate():
+        yield b'{"%s":[' % key.encode('utf-8')
+
+        separator = b''
+        chunk = []
+        for row in rows:
+            chunk.append(separator)
+            chunk.append(dumps(format_row(row)))
+            separator = b','
+
+            if len(chunk) >= 2 * batch_size:
+                yield b''.join(chunk)
+                chunk = []
+
+        chunk.append(b'],"status_code":200,"success":true}\n')
+        yield b''.join(chunk)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/json')
@@ -0,0 +1,210 @@
+from database.models import Actor, Movie
+
+
+# Range of the Integer columns (32 bit on PostgreSQL)
+MIN_INTEGER = -2 ** 31
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def parse_integer(value):
+    '''
+    parse_integer(value)
+    Returns value as an int if it is an integer: an int, a float with
+    no fractional part or the text of an integer (i.e. a CSV value).
+    Returns None otherwise, including for booleans and
+    the Infinity and NaN values the JSON parser accepts.
+    '''
+    value_type = type(value)
+
+    if value_type is int:
+        return value
+
+    if value_type is float:
+        return int(value) if value.is_integer() else None
+
+    if value_type is str:
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    return None
+
+
+def in_integer_range(value):
+    return MIN_INTEGER <= value <= MAX_INTEGER
+
+
+class String:
+    '''
+    String Field
+    A non empty string of at most max_length characters, without the NUL
+    characters PostgreSQL rejects, optionally one of choices
+    '''
+
+    def __init__(self, label, max_length=None, choices=None):
+        self.label = label
+        self.max_length = max_length
+        self.choices = choices
+
+    def compile(self, name, partial=False):
+        '''
+        compile(name, partial=False)
+        Returns a function checking the field name of a record: it adds
+        the value to values and returns None, or returns the error of
+        the field, a missing field being valid if partial.
+        '''
+        missing = None if partial else (400, f'{self.label} is required.')
+        wrong_type = (400, f'{self.label} must be a string.')
+        empty = (422, f'{self.label} must not be empty.')
+        too_long = (422, (
+            f'{self.label} must be at most {self.max_length} characters.'))
+        nul = (422, f'{self.label} must not contain NUL characters.')
+        max_length = self.max_length or float('inf')
+        choices = frozenset(self.choices) if self.choices else None
+        not_a_choice = (422, (
+            f'{self.label} must be either '
+            + ' or '.join(self.choices or ()) + '.'))
+
+        def check(record, values):
+            value = record.get(name)
+            if type(value) is not str:
+                return missing if value is None else wrong_type
+
+            values[name] = value
+            if not value:
+                return empty
+            if len(value) > max_length:
+                return too_long
+            if '\0' in value:
+                return nul
+            if choices is not None and value not in choices:
+                return not_a_choice
+            return None
+
+        return check
+
+
+class Integer:
+    '''
+    Integer Field
+    An integer of the range of the Integer columns, at least minimum.
+    Integral floats and the text of integers are coerced to int.
+    '''
+
+    def __init__(self, label, minimum=MIN_INTEGER):
+        self.label = label
+        self.minimum = minimum
+
+    def compile(self, name, partial=False):
+        '''
+        compile(name, partial=False)
+        Returns the function checking the field name, see String
+        '''
+        missing = None if partial else (400, f'{self.label} is required.')
+        wrong_type = (400, f'{self.label} must be an integer.')
+        out_of_range = (422, f'{self.label} is out of range.')
+        too_small = (422, f'{self.label} must be at least {self.minimum}.')
+        minimum = self.minimum
+
+        def check(record, values):
+            value = record.get(name)
+            if type(value) is not int:
+                if value is None:
+                    return missing
+                value = parse_integer(value)
+                if value is None:
+                    return wrong_type
+
+            values[name] = value
+            if not MIN_INTEGER <= value <= MAX_INTEGER:
+                return out_of_range
+            if value < minimum:
+                return too_small
+            return None
+
+        return check
+
+
+def column_length(column):
+    return column.property.columns[0].type.length
+
+
+# The fields of the records written by the API, in the order they are
+# checked. Every field is required on create and optional on update.
+ACTOR_SCHEMA = {
+    'name': String('Name', max_length=column_length(Actor.name)),
+    'age': Integer('Age', minimum=1),
+    'gender': String(
+        'Gender', max_length=column_length(Actor.gender),
+        choices=('Male', 'Female'))
+}
+
+MOVIE_SCHEMA = {
+    'title': String('Title', max_length=column_length(Movie.title)),
+    'release_year': Integer('Release year', minimum=1)
+}
+
+
+def compile_validator(schema, partial=False):
+    '''
+    compile_validator(schema, partial=False)
+    Returns a function validating a record against schema, with the
+    checks of its fields built once.
+    All the fields are required, unless partial, where missing and null
+    fields are skipped (i.e. an update).
+    The function returns a tuple of (values, None) if the record is
+    valid, or (None, (status_code, description)) otherwise: 400 if a
+    field is missing or of the wrong type, checked first, 422 if a
+    value is invalid.
+    '''
+    not_object = (400, 'Expected a JSON object.')
+    checks = tuple(
+        field.compile(name, partial) for name, field in schema.items())
+
+    def validate(record):
+        if type(record) is not dict:
+            return None, not_object
+
+        values = {}
+        invalid = None
+        for check in checks:
+            error = check(record, values)
+            if error is not None:
+                if error[0] == 400:
+                    return None, error
+                if invalid is None:
+                    invalid = error
+
+        if invalid is not None:
+            return None, invalid
+        return values, None
+
+    return validate
+
+
+def validate_records(validate, records):
+    '''
+    validate_records(validate, records)
+    Validates records in one pass.
+    Returns the (index, values) of the valid records and the
+    (index, error) of the invalid ones, in order.
+    '''
+    valid = []
+    invalid = []
+
+    for index, record in enumerate(records):
+        values, error = validate(record)
+
+        if error is None:
+            valid.append((index, values))
+        else:
+            invalid.append((index, error))
+
+    return valid, invalid
+
+
+validate_actor = compile_validator(ACTOR_SCHEMA)
+validate_actor_patch = compile_validator(ACTOR_SCHEMA, partial=True)
+validate_movie = compile_validator(MOVIE_SCHEMA)
+validate_movie_patch = compile_validator(MOVIE_SCHEMA, partial=True)
@@ -1,20 +1,101 @@
 import os
+import csv
 import json
-from flask import Flask, request, abort, jsonify
+import time
+import click
+from flask import Flask, Response, request, abort
 from flask_cors import CORS
-from flask_migrate import Migrate
 from sqlalchemy import exc
 
-from database.models import setup_db, Actor, Movie
-from auth.auth import requires_auth, AuthError
+from database.models import setup_db, Actor, Movie, Cast
+from database.models import add_cast, remove_cast
+from database.pool import pool_status
+from database.stats import StatsSummary, get_stats, refresh_stats
+from database.stats import setup_stats
+from metrics.hooks import export_metrics, record_startup, setup_metrics
+from metrics.queries import query_budget
+from auth.auth import requires_auth, requires_internal_token
+from auth.auth import check_permissions, AuthError
+from api.bulk import get_bulk_records, get_bulk_ids, get_bulk_patch
+from api.bulk import create_bulk, update_bulk, delete_bulk
+from api.cache import cached, setup_response_cache
+from api.compression import setup_compression
+from api.etag import conditional
+from api.export import parse_export, export_response
+from api.filters import apply_filters, ACTOR_FILTERS, MOVIE_FILTERS
+from api.imports import ImportReport, get_import_format, parse_import_format
+from api.imports import import_records, read_records
+from api.include import parse_include, include_related, load_related
+from api.include import ACTOR_INCLUDES, MOVIE_INCLUDES
+from api.json_provider import setup_json_provider
+from api.pagination import paginate, parse_sort
+from api.projection import parse_fields, project, format_row, format_rows
+from api.responses import jsonify
+from api.search import parse_search, search
+from api.streaming import is_stream_requested, stream_rows, stream_json_list
+from api.validation import validate_actor, validate_movie
+from api.validation import validate_actor_patch, validate_movie_patch
 
 
 def create_app(test_config=None):
     # Create and configure the app
+    started = time.perf_counter()
     app = Flask(__name__)
     CORS(app)
     db = setup_db(app)
-    migrate = Migrate(app, db)
+
+    # flask_migrate imports alembic, which doubles the import time of the
+    # app, and only the flask db commands need it
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    setup_metrics(app)
+    setup_json_provider(app)
+    setup_compression(app)
+    setup_response_cache(app)
+    setup_stats(app)
+
+    # Refreshes the summary read by /stats in summary mode
+    @app.cli.command('refresh-stats')
+    def refresh_stats_command():
+        refresh_stats()
+
+    imports = {
+        'actors': (Actor, validate_actor),
+        'movies': (Movie, validate_movie)
+    }
+
+    # Imports a CSV or NDJSON file, i.e. flask import actors actors.csv
+    @app.cli.command('import')
+    @click.argument('table', type=click.Choice(list(imports)))
+    @click.argument('file', type=click.File('rb'))
+    @click.option('--format', 'import_format', help='csv or ndjson')
+    @click.option(
+        '--errors', type=click.File('w'),
+        help='Writes the invalid records to this file as JSON lines.')
+    def import_command(table, file, import_format, errors):
+        import_format = get_import_format(
+            import_format or os.path.splitext(file.name)[1][1:])
+        if import_format is None:
+            raise click.UsageError('--format must be csv or ndjson.')
+
+        model, validate = imports[table]
+        started = time.perf_counter()
+        try:
+            report = import_records(
+                model, read_records(file, import_format), validate,
+                ImportReport(error_file=errors))
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise click.ClickException(f'Unreadable records: {error}')
+        except exc.SQLAlchemyError as error:
+            raise click.ClickException(
+                f'Import failed: {getattr(error, "orig", error)}')
+        seconds = time.perf_counter() - started
+
+        click.echo(
+            f'Imported {report.imported} {table} in {seconds:.1f} s, '
+            f'{report.invalid} invalid records.')
 
     # Welcome Endpoint
     @app.route('/')
@@ -23,51 +104,97 @@ def create_app(test_config=None):
             "message": "Welcome to Casting Agency API. Please use the endpoints /actors & /movies with an authorized JWT token to begin using the API. Thank you!"
         })
 
+    # Connection Pool Statistics
+    # Internal endpoint, requires the INTERNAL_API_TOKEN bearer token
+    @app.route('/internal/pool')
+    @requires_internal_token
+    def connection_pool_endpoint():
+        replicas = app.extensions.get('replicas')
+        replica_engines = replicas.engines if replicas else []
+
+        return jsonify({
+            "success": True,
+            "status_code": 200,
+            "pool": pool_status(db.engine.pool),
+            "replica_pools": [
+                pool_status(engine.pool) for engine in replica_engines
+            ]
+        })
+
+    # Response Cache Statistics
+    # Internal endpoint, requires the INTERNAL_API_TOKEN bearer token
+    @app.route('/internal/cache')
+    @requires_internal_token
+    def response_cache_endpoint():
+        cache = app.extensions.get('response_cache')
+
+        return jsonify({
+            "success": True,
+            "status_code": 200,
+            "cache": cache.stats() if cache else None
+        })
+
+    # Prometheus Metrics
+    # Internal endpoint, requires the INTERNAL_API_TOKEN bearer token
+    @app.route('/metrics')
+    @requires_internal_token
+    def metrics_endpoint():
+        return Response(
+            export_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
     '''
     Actor Endpoints
     '''
     # Retrive Actor List
     @app.route('/actors', methods=['GET'])
+    @query_budget(3)
     @requires_auth('get:actors')
+    @conditional(Actor, includes=ACTOR_INCLUDES)
+    @cached(Actor)
     def retrieve_actors_list(jwt):
         try:
-            actors = Actor.query.all()
-            formatted_actors = [actor.format() for actor in actors]
+            fields = parse_fields(Actor, request.args)
+            include = parse_include(ACTOR_INCLUDES, request.args)
+
+            if is_stream_requested(request.args):
+                if include:
+                    abort(400, description=(
+                        'Bad Request. include can not be streamed.'))
+                query = apply_filters(
+                    project(Actor, fields), ACTOR_FILTERS, request.args)
+                actors = stream_rows(query.order_by(Actor.id))
+                return stream_json_list(
+                    'actors', actors, lambda row: format_row(row, fields))
+
+            sort = parse_sort(Actor, request.args)
+            query = apply_filters(
+                project(Actor, fields, sort.key), ACTOR_FILTERS, request.args)
+            actors, next_cursor = paginate(query, Actor, request.args, sort)
+            formatted_actors = include_related(
+                format_rows(actors, fields), ACTOR_INCLUDES, include)
 
             return jsonify({
                 "success": True,
                 "status_code": 200,
-                "actors": formatted_actors
+                "actors": formatted_actors,
+                "next_cursor": next_cursor
             })
         except exc.SQLAlchemyError:
             abort(400)
 
     # Create Actor
     @app.route('/actors', methods=['POST'])
+    @query_budget(3)
     @requires_auth('post:actors')
     def create_actor(jwt):
         try:
-            body = request.get_json()
+            values, error = validate_actor(request.get_json())
 
-            name = body.get('name')
-            age = int(body.get('age'))
-            gender = body.get('gender')
-
-            if (
-                type(name) is not str
-                or type(age) is not int
-                or type(gender) is not str
-            ):
-                abort(400)
-
-            if (
-                name == ''
-                or age <= 0
-                or (gender != 'Male' and gender != 'Female')
-            ):
-                abort(422)
-        
-            actor = Actor(name=name, age=age, gender=gender)
+            if error is not None:
+                abort(error[0], description=error[1])
+
+            actor = Actor(**values)
             actor.insert()
 
             return jsonify({
@@ -77,15 +204,35 @@ def create_app(test_config=None):
             })
         except exc.SQLAlchemyError:
             abort(400, description="Bad Request. SQLAlchemy Error.")
-        except ValueError:
-            abort(400, description="Bad Request. ValueError")
+
+    # Create Actors in Bulk
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('post:actors')
+    def create_actors_bulk(jwt):
+        try:
+            records = get_bulk_records(request.get_json())
+            results = create_bulk(Actor, records, validate_actor)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "results": results,
+                "created_count": sum('id' in result for result in results)
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
 
     # Retrive Actor
     @app.route('/actors/<int:actor_id>', methods=['GET'])
+    @query_budget(2)
     @requires_auth('get:actors')
+    @conditional(Actor)
+    @cached(Actor)
     def retrive_actor(jwt, actor_id):
         try:
-            actor = Actor.query.get(actor_id)
+            fields = parse_fields(Actor, request.args)
+            actor = project(Actor, fields).filter(
+                Actor.id == actor_id).first()
 
             if actor is None:
                 abort(404)
@@ -93,13 +240,38 @@ def create_app(test_config=None):
             return jsonify({
                 "success": True,
                 "status_code": 200,
-                "actor": actor.format()
+                "actor": format_row(actor, fields)
+            })
+        except exc.SQLAlchemyError:
+            abort(400)
+
+    # Retrieve Movies of Actor
+    @app.route('/actors/<int:actor_id>/movies', methods=['GET'])
+    @query_budget(3)
+    @requires_auth('get:movies')
+    @conditional(Actor, Cast, Movie)
+    @cached(Actor, Cast, Movie)
+    def retrieve_actor_movies(jwt, actor_id):
+        try:
+            if project(Actor, ('id',)).filter(
+                Actor.id == actor_id
+            ).first() is None:
+                abort(404)
+
+            movies = load_related(ACTOR_INCLUDES['movies'], [actor_id])
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "actor_id": actor_id,
+                "movies": movies[actor_id]
             })
         except exc.SQLAlchemyError:
             abort(400)
 
     # Update Actor
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
+    @query_budget(4)
     @requires_auth('patch:actors')
     def update_actor(jwt, actor_id):
         try:
@@ -108,34 +280,13 @@ def create_app(test_config=None):
             if actor is None:
                 abort(404)
 
-            body = request.get_json()
-            name = body.get('name')
-            age = body.get('age')
-            gender = body.get('gender')
-
-            if name is not None:
-                if type(name) is not str:
-                    abort(400)
-                if name == '':
-                    abort(422)
-
-                actor.name = name
-
-            if age is not None:
-                if type(age) is not int:
-                    abort(400)
-                if age <= 0:
-                    abort(422)
-
-                actor.age = age
+            values, error = validate_actor_patch(request.get_json())
 
-            if gender is not None:
-                if type(gender) is not str:
-                    abort(400)
-                if gender != 'Male' and gender != 'Female':
-                    abort(422)
+            if error is not None:
+                abort(error[0], description=error[1])
 
-                actor.gender = gender
+            for name, value in values.items():
+                setattr(actor, name, value)
 
             actor.update()
 
@@ -149,6 +300,7 @@ def create_app(test_config=None):
 
     # Delete Actor
     @app.route('/actors/<int:actor_id>', methods=['DELETE'])
+    @query_budget(3)
     @requires_auth('delete:actors')
     def delete_actor(jwt, actor_id):
         try:
@@ -166,48 +318,94 @@ def create_app(test_config=None):
         except exc.SQLAlchemyError:
             abort(400)
 
+    # Update Actors in Bulk
+    @app.route('/actors/bulk', methods=['PATCH'])
+    @requires_auth('patch:actors')
+    def update_actors_bulk(jwt):
+        try:
+            body = request.get_json()
+            ids = get_bulk_ids(body)
+            values = get_bulk_patch(body, validate_actor_patch)
+            updated_ids, not_found_ids = update_bulk(Actor, ids, values)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "updated_ids": updated_ids,
+                "not_found_ids": not_found_ids
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+    # Delete Actors in Bulk
+    @app.route('/actors/bulk', methods=['DELETE'])
+    @requires_auth('delete:actors')
+    def delete_actors_bulk(jwt):
+        try:
+            ids = get_bulk_ids(request.get_json())
+            deleted_ids, not_found_ids = delete_bulk(Actor, ids)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "deleted_ids": deleted_ids,
+                "not_found_ids": not_found_ids
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
     '''
     Movie Endpoints
     '''
     # Retrieve Movie List
     @app.route('/movies')
+    @query_budget(3)
     @requires_auth('get:movies')
+    @conditional(Movie, includes=MOVIE_INCLUDES)
+    @cached(Movie)
     def retrieve_movies_list(jwt):
         try:
-            movies = Movie.query.all()
-            formatted_movies = [movie.format() for movie in movies]
+            fields = parse_fields(Movie, request.args)
+            include = parse_include(MOVIE_INCLUDES, request.args)
+
+            if is_stream_requested(request.args):
+                if include:
+                    abort(400, description=(
+                        'Bad Request. include can not be streamed.'))
+                query = apply_filters(
+                    project(Movie, fields), MOVIE_FILTERS, request.args)
+                movies = stream_rows(query.order_by(Movie.id))
+                return stream_json_list(
+                    'movies', movies, lambda row: format_row(row, fields))
+
+            sort = parse_sort(Movie, request.args)
+            query = apply_filters(
+                project(Movie, fields, sort.key), MOVIE_FILTERS, request.args)
+            movies, next_cursor = paginate(query, Movie, request.args, sort)
+            formatted_movies = include_related(
+                format_rows(movies, fields), MOVIE_INCLUDES, include)
 
             return jsonify({
                 "success": True,
                 "status_code": 200,
-                "movies": formatted_movies
+                "movies": formatted_movies,
+                "next_cursor": next_cursor
             })
         except exc.SQLAlchemyError:
             abort(400)
 
     # Create Movie
     @app.route('/movies', methods=['POST'])
+    @query_budget(3)
     @requires_auth('post:movies')
     def create_movie(jwt):
         try:
-            body = request.get_json()
-
-            title = body.get('title')
-            release_year = int(body.get('release_year'))
-
-            if (
-                type(title) is not str
-                or type(release_year) is not int
-            ):
-                abort(400)
+            values, error = validate_movie(request.get_json())
 
-            if (
-                title == ''
-                or release_year <= 0
-            ):
-                abort(422)
+            if error is not None:
+                abort(error[0], description=error[1])
 
-            movie = Movie(title=title, release_year=release_year)
+            movie = Movie(**values)
             movie.insert()
 
             return jsonify({
@@ -217,15 +415,35 @@ def create_app(test_config=None):
             })
         except exc.SQLAlchemyError:
             abort(400, description="Bad Request. SQLAlchemy Error.")
-        except ValueError:
-            abort(400, description="Bad Request. ValueError")
+
+    # Create Movies in Bulk
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('post:movies')
+    def create_movies_bulk(jwt):
+        try:
+            records = get_bulk_records(request.get_json())
+            results = create_bulk(Movie, records, validate_movie)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "results": results,
+                "created_count": sum('id' in result for result in results)
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
 
     # Retrieve Movie
     @app.route('/movies/<int:movie_id>', methods=['GET'])
+    @query_budget(2)
     @requires_auth('get:movies')
+    @conditional(Movie)
+    @cached(Movie)
     def retrive_movie(jwt, movie_id):
         try:
-            movie = Movie.query.get(movie_id)
+            fields = parse_fields(Movie, request.args)
+            movie = project(Movie, fields).filter(
+                Movie.id == movie_id).first()
 
             if movie is None:
                 abort(404)
@@ -233,13 +451,79 @@ def create_app(test_config=None):
             return jsonify({
                 "success": True,
                 "status_code": 200,
-                "movie": movie.format()
+                "movie": format_row(movie, fields)
+            })
+        except exc.SQLAlchemyError:
+            abort(400)
+
+    # Retrieve Cast of Movie
+    @app.route('/movies/<int:movie_id>/actors', methods=['GET'])
+    @query_budget(3)
+    @requires_auth('get:actors')
+    @conditional(Movie, Cast, Actor)
+    @cached(Movie, Cast, Actor)
+    def retrieve_movie_actors(jwt, movie_id):
+        try:
+            if project(Movie, ('id',)).filter(
+                Movie.id == movie_id
+            ).first() is None:
+                abort(404)
+
+            actors = load_related(MOVIE_INCLUDES['actors'], [movie_id])
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "movie_id": movie_id,
+                "actors": actors[movie_id]
+            })
+        except exc.SQLAlchemyError:
+            abort(400)
+
+    # Add Actors to Cast of Movie
+    @app.route('/movies/<int:movie_id>/actors', methods=['POST'])
+    @requires_auth('patch:movies')
+    def add_movie_actors(jwt, movie_id):
+        try:
+            ids = get_bulk_ids(request.get_json())
+
+            if project(Movie, ('id',)).filter(
+                Movie.id == movie_id
+            ).first() is None:
+                abort(404)
+
+            added_ids, not_found_ids = add_cast(movie_id, ids)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "added_ids": added_ids,
+                "not_found_ids": not_found_ids
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+    # Remove Actor from Cast of Movie
+    @app.route(
+        '/movies/<int:movie_id>/actors/<int:actor_id>', methods=['DELETE'])
+    @query_budget(3)
+    @requires_auth('patch:movies')
+    def remove_movie_actor(jwt, movie_id, actor_id):
+        try:
+            if not remove_cast(movie_id, actor_id):
+                abort(404)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "deleted_id": actor_id
             })
         except exc.SQLAlchemyError:
             abort(400)
 
     # Update Movie
     @app.route('/movies/<int:movie_id>', methods=['PATCH'])
+    @query_budget(4)
     @requires_auth('patch:movies')
     def update_movie(jwt, movie_id):
         try:
@@ -248,25 +532,13 @@ def create_app(test_config=None):
             if movie is None:
                 abort(404)
 
-            body = request.get_json()
-            title = body.get('title')
-            release_year = body.get('release_year')
-
-            if title is not None:
-                if type(title) is not str:
-                    abort(400)
-                if title == '':
-                    abort(422)
+            values, error = validate_movie_patch(request.get_json())
 
-                movie.title = title
+            if error is not None:
+                abort(error[0], description=error[1])
 
-            if release_year is not None:
-                if type(release_year) is not int:
-                    abort(400)
-                if release_year <= 0:
-                    abort(422)
-
-                movie.release_year = release_year
+            for name, value in values.items():
+                setattr(movie, name, value)
 
             movie.update()
 
@@ -280,6 +552,7 @@ def create_app(test_config=None):
 
     # Delete Movie
     @app.route('/movies/<int:movie_id>', methods=['DELETE'])
+    @query_budget(3)
     @requires_auth('delete:movies')
     def delete_movie(jwt, movie_id):
         try:
@@ -297,6 +570,157 @@ def create_app(test_config=None):
         except exc.SQLAlchemyError:
             abort(400)
 
+    # Update Movies in Bulk
+    @app.route('/movies/bulk', methods=['PATCH'])
+    @requires_auth('patch:movies')
+    def update_movies_bulk(jwt):
+        try:
+            body = request.get_json()
+            ids = get_bulk_ids(body)
+            values = get_bulk_patch(body, validate_movie_patch)
+            updated_ids, not_found_ids = update_bulk(Movie, ids, values)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "updated_ids": updated_ids,
+                "not_found_ids": not_found_ids
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+    # Delete Movies in Bulk
+    @app.route('/movies/bulk', methods=['DELETE'])
+    @requires_auth('delete:movies')
+    def delete_movies_bulk(jwt):
+        try:
+            ids = get_bulk_ids(request.get_json())
+            deleted_ids, not_found_ids = delete_bulk(Movie, ids)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "deleted_ids": deleted_ids,
+                "not_found_ids": not_found_ids
+            })
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+    '''
+    Search Endpoint
+    '''
+    # Search Actors and Movies
+    @app.route('/search')
+    @query_budget(3)
+    @requires_auth('get:actors')
+    @conditional(Actor, Movie)
+    @cached(Actor, Movie)
+    def search_endpoint(jwt):
+        try:
+            search_text, limit = parse_search(request.args)
+            search_type = request.args.get('type')
+
+            if search_type not in (None, 'actors', 'movies'):
+                abort(400, description="Bad Request. Unknown search type.")
+
+            results = {}
+
+            if search_type in (None, 'actors'):
+                results['actors'] = search(Actor, 'name', search_text, limit)
+
+            if search_type in (None, 'movies'):
+                check_permissions('get:movies', jwt)
+                results['movies'] = search(
+                    Movie, 'title', search_text, limit)
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                **results
+            })
+        except exc.SQLAlchemyError:
+            abort(400)
+
+    # Aggregate Statistics
+    @app.route('/stats')
+    @query_budget(4)
+    @requires_auth('get:actors')
+    @conditional(Actor, Movie, StatsSummary)
+    @cached(Actor, Movie, StatsSummary)
+    def stats_endpoint(jwt):
+        check_permissions('get:movies', jwt)
+
+        try:
+            stats, refreshed_at = get_stats(app.extensions['stats_mode'])
+
+            return jsonify({
+                "success": True,
+                "status_code": 200,
+                "refreshed_at": (
+                    refreshed_at.isoformat() + 'Z' if refreshed_at else None),
+                **stats
+            })
+        except exc.SQLAlchemyError:
+            abort(400)
+
+    # Imports
+    # The body is a CSV or NDJSON stream, its format is given by the
+    # format argument or the Content-Type
+    @app.route('/import/actors', methods=['POST'])
+    @requires_auth('post:actors')
+    def import_actors(jwt):
+        import_format = parse_import_format(request.args, request.mimetype)
+
+        try:
+            report = import_records(
+                Actor, read_records(request.stream, import_format),
+                validate_actor)
+        except (UnicodeDecodeError, csv.Error):
+            abort(400, description='Bad Request. Unreadable records.')
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+        return jsonify({
+            "success": True,
+            "status_code": 200,
+            **report.format()
+        })
+
+    @app.route('/import/movies', methods=['POST'])
+    @requires_auth('post:movies')
+    def import_movies(jwt):
+        import_format = parse_import_format(request.args, request.mimetype)
+
+        try:
+            report = import_records(
+                Movie, read_records(request.stream, import_format),
+                validate_movie)
+        except (UnicodeDecodeError, csv.Error):
+            abort(400, description='Bad Request. Unreadable records.')
+        except exc.SQLAlchemyError:
+            abort(400, description="Bad Request. SQLAlchemy Error.")
+
+        return jsonify({
+            "success": True,
+            "status_code": 200,
+            **report.format()
+        })
+
+    # Exports
+    @app.route('/export/actors')
+    @query_budget(2)
+    @requires_auth('get:actors')
+    def export_actors(jwt):
+        export_format, since = parse_export(request.args)
+        return export_response(Actor, export_format, since)
+
+    @app.route('/export/movies')
+    @query_budget(2)
+    @requires_auth('get:movies')
+    def export_movies(jwt):
+        export_format, since = parse_export(request.args)
+        return export_response(Movie, export_format, since)
+
     '''
     Error Handling
     '''
@@ -371,7 +795,8 @@ def create_app(test_config=None):
             400: "Bad Request",
             401: "Unauthorized",
             403: "Forbidden",
-            422: "Unprocessable Entity"
+            422: "Unprocessable Entity",
+            503: "Service Unavailable"
         }
         status_code_message = messages.get(
             status_code,
@@ -386,10 +811,19 @@ def create_app(test_config=None):
             "code": error_code
         }), status_code
 
+    record_startup('create_app', time.perf_counter() - started)
     return app
 
 
-APP = create_app()
+def __getattr__(name):
+    # APP is created on first use, so importing this module has no side
+    # effects. gunicorn serves app:create_app() directly.
+    if name == 'APP':
+        globals()['APP'] = create_app()
+        return globals()['APP']
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 if __name__ == '__main__':
-    APP.run(host='0.0.0.0', port=5000, debug=False)
+    create_app().run(host='0.0.0.0', port=5000, debug=False)
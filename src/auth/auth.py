@@ -1,14 +1,41 @@
 import os
-import json
-from flask import request, _request_ctx_stack
+import hmac
+from flask import abort, request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from metrics.hooks import REGISTRY, timed_phase
+from .jwks import JWKSKeyStore, JWKSUnavailableError, fetch_jwks
+from .token_cache import TokenCache
 
 
 AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
 ALGORITHMS = [os.environ['AUTH_ALGORITHMS']]
 API_AUDIENCE = os.environ['API_AUDIENCE']
+# Bearer token of the internal endpoints, which are hidden when it is unset
+INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN')
+AUTH0_JWKS_URL = os.environ.get(
+    'AUTH0_JWKS_URL',
+    f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+
+def timed_fetch_jwks(url, timeout=5):
+    with timed_phase('jwks_fetch'):
+        return fetch_jwks(url, timeout=timeout)
+
+
+JWKS_STORE = JWKSKeyStore(
+    AUTH0_JWKS_URL,
+    ttl=int(os.environ.get('JWKS_CACHE_TTL', 600)),
+    stale_ttl=int(os.environ.get('JWKS_STALE_TTL', 86400)),
+    refetch_interval=int(os.environ.get('JWKS_REFETCH_INTERVAL', 30)),
+    fetch=timed_fetch_jwks)
+
+TOKEN_CACHE = TokenCache(
+    max_size=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)),
+    negative_ttl=int(os.environ.get('TOKEN_NEGATIVE_CACHE_TTL', 30)),
+    record=lambda result: REGISTRY.inc(
+        'token_cache_requests_total', {'result': result}))
 
 
 # AuthError Exception
@@ -72,6 +99,7 @@ def verify_decode_jwt(token):
 
         it should be an Auth0 token with key id (kid)
         it should verify the token using Auth0 /.well-known/jwks.json
+            the keys are cached by kid in JWKS_STORE
         it should decode the payload from the token
         it should validate the claims
         return the decoded payload
@@ -79,10 +107,13 @@ def verify_decode_jwt(token):
         !!NOTE urlopen has a common certificate error described here:
         https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
     '''
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
     if 'kid' not in unverified_header:
         raise AuthError({
@@ -90,25 +121,24 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = JWKS_STORE.get_key(unverified_header['kid'])
+    except JWKSUnavailableError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
 
     if rsa_key:
         try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
+            with timed_phase('jwt_decode'):
+                payload = jwt.decode(
+                    token,
+                    rsa_key,
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer='https://' + AUTH0_DOMAIN + '/'
+                )
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -136,12 +166,13 @@ def verify_decode_jwt(token):
     }, 400)
 
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permissions=None):
     '''
     @DONE implement check_permissions(permission, payload) method
         @INPUTS
             permission: string permission (i.e. 'post:drink')
             payload: decoded jwt payload
+            permissions: optional precomputed set of the payload permissions
 
         it should raise an AuthError if permissions
             are not included in the payload
@@ -151,13 +182,16 @@ def check_permissions(permission, payload):
         return true otherwise
     '''
 
-    if 'permissions' not in payload:
-        raise AuthError({
-            'code': 'invalid_claims',
-            'description': 'Permissions not included in JWT.'
-        }, 400)
+    if permissions is None:
+        if 'permissions' not in payload:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Permissions not included in JWT.'
+            }, 400)
 
-    if permission not in payload['permissions']:
+        permissions = payload['permissions']
+
+    if permission not in permissions:
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -166,6 +200,15 @@ def check_permissions(permission, payload):
     return True
 
 
+def is_cacheable_auth_error(error):
+    '''
+    is_cacheable_auth_error(error)
+    Verification failures caused by the token itself are negative cached,
+    failures to reach the JWKS endpoint are not.
+    '''
+    return isinstance(error, AuthError) and error.status_code != 503
+
+
 def requires_auth(permission=''):
     '''
     @DONE implement @requires_auth(permission) decorator method
@@ -174,6 +217,7 @@ def requires_auth(permission=''):
 
         it should use the get_token_auth_header method to get the token
         it should use the verify_decode_jwt method to decode the jwt
+            verified payloads are cached by token digest in TOKEN_CACHE
         it should use the check_permissions method validate claims
             and check the requested permission
         return the decorator which passes the decoded payload
@@ -183,9 +227,37 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, permissions = TOKEN_CACHE.get_or_verify(
+                token, verify_decode_jwt, is_cacheable_auth_error)
+            check_permissions(permission, payload, permissions)
+            _request_ctx_stack.top.current_user = payload
             return f(payload, *args, **kwargs)
 
         return wrapper
     return requires_auth_decorator
+
+
+def requires_internal_token(f):
+    '''
+    @requires_internal_token decorator
+        it should hide the endpoint (404) when INTERNAL_API_TOKEN is unset
+        it should use the get_token_auth_header method to get the token
+            it should raise an AuthError if it is not INTERNAL_API_TOKEN
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not INTERNAL_API_TOKEN:
+            abort(404)
+
+        token = get_token_auth_header()
+        if not hmac.compare_digest(
+            token.encode('utf-8'), INTERNAL_API_TOKEN.encode('utf-8')
+        ):
+            raise AuthError({
+                'code': 'invalid_token',
+                'description': 'Invalid internal token.'
+            }, 401)
+
+        return f(*args, **kwargs)
+
+    return wrapper
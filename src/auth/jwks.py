@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+
+logger = logging.getLogger(__name__)
+
+# Default of refresh(), forcing a fetch
+_ANY = object()
+
+
+class JWKSUnavailableError(Exception):
+    '''
+    JWKSUnavailableError Exception
+    Raised when no signing keys could be loaded from the JWKS document
+    '''
+    pass
+
+
+def fetch_jwks(url, timeout=5):
+    '''
+    fetch_jwks(url)
+    Downloads and parses a JWKS document.
+    Any url supported by urlopen works, including file:// urls
+    which allow running against a local JWKS file.
+    '''
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class JWKSKeyStore:
+    '''
+    JWKSKeyStore
+    Caches the signing keys of a JWKS document by key id (kid)
+
+    Keys are fresh for `ttl` seconds. After that they are still served
+    for up to `stale_ttl` seconds while a background thread refreshes
+    them (stale-while-revalidate). Past `ttl + stale_ttl` they are refreshed
+    before use, and JWKSUnavailableError is raised if that fails.
+    An unknown kid triggers a refetch, at most once every
+    `refetch_interval` seconds.
+    '''
+
+    def __init__(self, url, ttl=600, stale_ttl=86400,
+                 refetch_interval=30, timeout=5, fetch=fetch_jwks):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refetch_interval = refetch_interval
+        self.timeout = timeout
+        self._fetch = fetch
+
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_key(self, kid):
+        '''
+        get_key(kid)
+        Returns the rsa key for the given kid, or None if the
+        JWKS document does not contain it.
+        '''
+        fetched_at = self._fetched_at
+
+        if self._is_expired(fetched_at):
+            if self._may_refetch():
+                self.refresh(fetched_at)
+            if self._is_expired(self._fetched_at):
+                raise JWKSUnavailableError(self.url)
+        elif time.monotonic() - fetched_at >= self.ttl:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._may_refetch():
+            self.refresh(self._fetched_at)
+            key = self._keys.get(kid)
+
+        return key
+
+    def refresh(self, fetched_at=_ANY):
+        '''
+        refresh(fetched_at=_ANY)
+        Fetches the JWKS document and replaces the cached keys.
+        Previously cached keys are kept if the fetch fails.
+        Given the fetched_at the caller saw, it does nothing if another
+        thread refreshed the keys, or tried to, while it waited for the lock.
+        '''
+        with self._lock:
+            if fetched_at is not _ANY and (
+                self._fetched_at != fetched_at or not self._may_refetch()
+            ):
+                return
+
+            self._last_attempt = time.monotonic()
+            try:
+                jwks = self._fetch(self.url, timeout=self.timeout)
+                keys = {}
+                for key in jwks['keys']:
+                    keys[key['kid']] = {
+                        'kty': key['kty'],
+                        'kid': key['kid'],
+                        'use': key['use'],
+                        'n': key['n'],
+                        'e': key['e']
+                    }
+            except Exception:
+                logger.exception('Unable to fetch JWKS from %s', self.url)
+                return
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def _is_expired(self, fetched_at):
+        return (
+            fetched_at is None
+            or time.monotonic() - fetched_at >= self.ttl + self.stale_ttl
+        )
+
+    def _may_refetch(self):
+        last_attempt = self._last_attempt
+        return (
+            last_attempt is None
+            or time.monotonic() - last_attempt >= self.refetch_interval
+        )
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or not self._may_refetch():
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
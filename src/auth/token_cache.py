@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    '''
+    TokenCache
+    Bounded, thread safe LRU cache of verified JWT payloads
+
+    Entries are keyed by the sha256 digest of the token and expire at
+    the token's `exp` claim. Tokens that failed verification are kept
+    in a short lived negative cache together with the raised error,
+    which is raised again as a new exception on every hit.
+    `record`, if given, is called with hit, miss or negative_hit
+    for every lookup.
+    '''
+
+    def __init__(self, max_size=1024, negative_ttl=30, default_ttl=300,
+                 record=None):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.default_ttl = default_ttl
+        self.record = record
+
+        self._entries = OrderedDict()
+        self._negative = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def get_or_verify(self, token, verify, is_cacheable_error=None):
+        '''
+        get_or_verify(token, verify)
+        Returns a tuple of (payload, permissions) for the token.
+        `verify` is only called on a cache miss. `permissions` is a
+        frozenset of the permissions claim, or None if it is missing.
+        '''
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] <= now:
+                del self._entries[digest]
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+
+            negative = None
+            if entry is None:
+                negative = self._negative.get(digest)
+                if negative is not None and negative[0] <= now:
+                    del self._negative[digest]
+                    negative = None
+                elif negative is not None:
+                    self.negative_hits += 1
+                else:
+                    self.misses += 1
+
+        if entry is not None:
+            self._record('hit')
+            return entry[1], entry[2]
+
+        if negative is not None:
+            self._record('negative_hit')
+            # A new exception each time, re-raising the cached instance
+            # would grow its traceback with every request
+            raise negative[1](*negative[2])
+
+        self._record('miss')
+
+        try:
+            payload = verify(token)
+        except Exception as error:
+            if is_cacheable_error is None or is_cacheable_error(error):
+                self._store(
+                    self._negative, digest,
+                    (now + self.negative_ttl, type(error), error.args))
+            raise
+
+        permissions = None
+        if 'permissions' in payload:
+            permissions = frozenset(payload['permissions'])
+
+        expires_at = payload.get('exp', now + self.default_ttl)
+        self._store(self._entries, digest, (expires_at, payload, permissions))
+
+        return payload, permissions
+
+    def _record(self, result):
+        if self.record is not None:
+            self.record(result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._negative.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'negative_size': len(self._negative),
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits
+        }
+
+    def _store(self, entries, digest, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            entries[digest] = value
+            entries.move_to_end(digest)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
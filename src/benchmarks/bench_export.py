@@ -0,0 +1,74 @@
+'''
+Benchmark of the table exports
+
+Streams the actor table as NDJSON and CSV and reports the rows per second
+and the peak memory allocated by the export, which should stay flat as
+the table grows.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_export --rows 10000 1000000
+    python -m benchmarks.bench_export --database-url postgresql:///bench
+'''
+import os
+import argparse
+import time
+import tracemalloc
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+
+from database.models import setup_db, Actor
+from api.export import EXPORT_FORMATS, export_response
+from api.json_provider import setup_json_provider
+from .bench_projection import seed
+
+
+def export(app, export_format, trace=False):
+    with app.test_request_context():
+        response = export_response(Actor, export_format)
+        size = peak = 0
+
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        for chunk in response.response:
+            size += len(chunk)
+        seconds = time.perf_counter() - start
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        response.close()
+
+    return seconds, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, args.database_url, create_all=True)
+    setup_json_provider(app)
+
+    for rows in args.rows:
+        with app.app_context():
+            seed(rows)
+
+        for export_format in EXPORT_FORMATS:
+            seconds, _, size = export(app, export_format)
+            # Timed apart, tracemalloc slows the export down
+            _, peak, _ = export(app, export_format, trace=True)
+            print(
+                f'{rows:>9} rows  {export_format:>6}: '
+                f'{rows / seconds:>10.0f} rows/s  '
+                f'{size / 2 ** 20:8.1f} MiB sent  '
+                f'peak memory: {peak / 2 ** 20:6.2f} MiB')
+
+
+if __name__ == '__main__':
+    main()
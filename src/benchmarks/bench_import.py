@@ -0,0 +1,108 @@
+'''
+Benchmark of the table imports
+
+Imports generated actors as CSV and NDJSON through import_records, and
+compares their rows per second with one ORM insert and commit per row,
+as a loop of create_actor requests would do.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_import --rows 10000 1000000
+    python -m benchmarks.bench_import --database-url postgresql:///bench
+'''
+import os
+import argparse
+import csv
+import io
+import json
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+
+from database.models import setup_db, db, Actor
+from api.imports import import_records, read_records
+from api.validation import validate_actor
+
+# Rows of the one commit per row baseline, which is slow
+ORM_ROWS = 2000
+
+
+def generate(rows):
+    return [
+        {
+            'name': f'Actor {i}',
+            'age': 20 + i % 60,
+            'gender': 'Male' if i % 2 else 'Female'
+        }
+        for i in range(rows)
+    ]
+
+
+def encode(records, import_format):
+    if import_format == 'ndjson':
+        return ''.join(
+            json.dumps(record) + '\n' for record in records).encode()
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, Actor.FIELDS[1:], lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(records)
+    return output.getvalue().encode()
+
+
+def import_file(data, import_format):
+    db.session.query(Actor).delete()
+    db.session.commit()
+
+    start = time.perf_counter()
+    report = import_records(
+        Actor, read_records(io.BytesIO(data), import_format), validate_actor)
+    seconds = time.perf_counter() - start
+
+    assert report.imported == Actor.query.count()
+    return report.imported / seconds
+
+
+def orm_inserts(records):
+    db.session.query(Actor).delete()
+    db.session.commit()
+
+    start = time.perf_counter()
+    for record in records:
+        values, _ = validate_actor(record)
+        db.session.add(Actor(**values))
+        db.session.commit()
+    seconds = time.perf_counter() - start
+
+    return len(records) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, args.database_url, create_all=True)
+
+    with app.app_context():
+        orm_rate = orm_inserts(generate(ORM_ROWS))
+        print(
+            f'{ORM_ROWS:>9} rows  one commit per row: '
+            f'{orm_rate:>9.0f} rows/s')
+
+        for rows in args.rows:
+            records = generate(rows)
+            for import_format in ('csv', 'ndjson'):
+                rate = import_file(
+                    encode(records, import_format), import_format)
+                print(
+                    f'{rows:>9} rows  {import_format:>18}: {rate:>9.0f} rows/s'
+                    f'  {rate / orm_rate:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Micro-benchmark of the JSON providers
+
+Encodes a list response of Actor.format() dicts with the stdlib provider
+and with the orjson provider, checking both give the same bytes.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_json --rows 1000 100000
+'''
+import argparse
+import time
+
+from flask import Flask
+
+from api.json_provider import StdlibJSONProvider, OrjsonJSONProvider
+
+
+def actors_response(rows):
+    return {
+        'success': True,
+        'status_code': 200,
+        'actors': [
+            {
+                'id': i,
+                'name': f'Actor {i}',
+                'age': 20 + i % 60,
+                'gender': 'Male' if i % 2 else 'Female'
+            }
+            for i in range(rows)
+        ],
+        'next_cursor': None
+    }
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stdlib = StdlibJSONProvider()
+    fast = OrjsonJSONProvider()
+
+    with app.app_context():
+        for rows in args.rows:
+            data = actors_response(rows)
+            assert stdlib.dumps(data) == fast.dumps(data)
+
+            stdlib_time = best_of(lambda: stdlib.dumps(data), args.repeat)
+            fast_time = best_of(lambda: fast.dumps(data), args.repeat)
+
+            print(
+                f'{rows:>9} rows  '
+                f'stdlib: {stdlib_time * 1000:9.2f} ms  '
+                f'orjson: {fast_time * 1000:9.2f} ms  '
+                f'speedup: {stdlib_time / fast_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Micro-benchmark of the actor list read paths
+
+Compares building the response items through ORM instances and
+Actor.format() against the column projection fast path.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_projection --rows 10000 1000000
+'''
+import os
+import argparse
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask
+
+from database.models import setup_db, db, Actor
+from api.projection import project, format_rows
+
+
+def seed(rows):
+    db.session.query(Actor).delete()
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'name': f'Actor {i}',
+            'age': 20 + i % 60,
+            'gender': 'Male' if i % 2 else 'Female'
+        })
+        if len(batch) == 10000:
+            db.session.execute(Actor.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Actor.__table__.insert(), batch)
+    db.session.commit()
+
+
+def orm_format():
+    return [actor.format() for actor in Actor.query.order_by(Actor.id)]
+
+
+def projected():
+    fields = Actor.FIELDS
+    return format_rows(project(Actor, fields).order_by(Actor.id), fields)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, args.database_url, create_all=True)
+
+    with app.app_context():
+        for rows in args.rows:
+            seed(rows)
+            assert orm_format() == projected()
+
+            orm_time = best_of(orm_format, args.repeat)
+            projected_time = best_of(projected, args.repeat)
+
+            print(
+                f'{rows:>9} rows  '
+                f'format(): {orm_time * 1000:9.1f} ms  '
+                f'projection: {projected_time * 1000:9.1f} ms  '
+                f'speedup: {orm_time / projected_time:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+'''
+Startup benchmark of the application
+
+Measures, in fresh interpreters, the time to import app.py, to run
+create_app() and to serve the first request of a worker: the welcome
+message and a list of actors with a locally signed token.
+Prints the best and median of each phase as JSON, so releases can be
+compared.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --database-url postgresql:///bench
+'''
+import os
+import sys
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+
+from .loadtest import DOMAIN, AUDIENCE, generate_key, mint_token, serve_jwks
+from .loadtest import SRC_DIR
+
+
+# Runs in a fresh interpreter, prints the seconds of each phase as JSON
+PROBE = '''
+import json, os, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+assert client.get('/').status_code == 200
+welcomed = time.perf_counter()
+res = client.get('/actors', headers={
+    'Authorization': 'Bearer ' + os.environ['BENCH_TOKEN']})
+assert res.status_code == 200, res.data
+listed = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': welcomed - created,
+    'first_db_request': listed - welcomed
+}))
+'''
+
+
+def probe(env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], env=env, cwd=SRC_DIR,
+        check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the report to a file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or (
+            'sqlite:///' + os.path.join(directory, 'bench.db'))
+
+        private_key, jwks = generate_key()
+        jwks_server, jwks_url = serve_jwks(jwks)
+
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': database_url,
+            'AUTH0_DOMAIN': DOMAIN,
+            'AUTH0_JWKS_URL': jwks_url,
+            'AUTH_ALGORITHMS': 'RS256',
+            'API_AUDIENCE': AUDIENCE,
+            'BENCH_TOKEN': mint_token(private_key, 'assistant')
+        })
+
+        try:
+            # The schema is created once, as the migrations would
+            probe(dict(env, DATABASE_CREATE_ALL='true'))
+            runs = [probe(env) for _ in range(args.repeat)]
+        finally:
+            jwks_server.shutdown()
+
+    result = json.dumps({
+        'config': {
+            'repeat': args.repeat,
+            'database': database_url.split(':', 1)[0]
+        },
+        'phases_ms': {
+            phase: {
+                'best': round(min(run[phase] for run in runs) * 1000, 2),
+                'median': round(statistics.median(
+                    run[phase] for run in runs) * 1000, 2)
+            }
+            for phase in runs[0]
+        }
+    }, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(result + '\n')
+    else:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Micro-benchmark of the record validators
+
+Reports the cost per record of the compiled validators on batches of
+valid records, of invalid ones and of update patches, validated in one
+pass with validate_records like the bulk and import write paths.
+
+Usage (from the src folder):
+    python -m benchmarks.bench_validation --records 100000
+'''
+import os
+import argparse
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from api.validation import validate_actor, validate_actor_patch
+from api.validation import validate_movie, validate_records
+
+
+def actors(count):
+    return [
+        {
+            'name': f'Actor {i}',
+            'age': 20 + i % 60,
+            'gender': 'Male' if i % 2 else 'Female'
+        }
+        for i in range(count)
+    ]
+
+
+def csv_actors(count):
+    return [
+        dict(record, age=str(record['age'])) for record in actors(count)
+    ]
+
+
+def invalid_actors(count):
+    return [
+        [
+            {'name': 'Actor', 'age': 'abc', 'gender': 'Male'},
+            {'name': '', 'age': 30, 'gender': 'Male'},
+            {'name': 'Actor', 'age': 30, 'gender': 'Other'},
+            {'name': 'Actor', 'age': 30}
+        ][i % 4]
+        for i in range(count)
+    ]
+
+
+def movies(count):
+    return [
+        {'title': f'Movie {i}', 'release_year': 1950 + i % 70}
+        for i in range(count)
+    ]
+
+
+def patches(count):
+    return [{'age': 20 + i % 60} for i in range(count)]
+
+
+def best_of(validate, records, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        validate_records(validate, records)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, validate, records in [
+        ('valid actors', validate_actor, actors(args.records)),
+        ('CSV actors (str age)', validate_actor, csv_actors(args.records)),
+        ('invalid actors', validate_actor, invalid_actors(args.records)),
+        ('valid movies', validate_movie, movies(args.records)),
+        ('actor patches', validate_actor_patch, patches(args.records))
+    ]:
+        seconds = best_of(validate, records, args.repeat)
+        print(
+            f'{name:>22}: {seconds * 1e9 / args.records:7.0f} ns/record  '
+            f'{args.records / seconds:>10.0f} records/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+'''
+Offline HTTP load test of the API
+
+Starts the application under gunicorn against a local database and a local
+JWKS server, signs RS256 tokens for each role with a freshly generated key,
+and drives a mixed read/write workload at a fixed concurrency.
+Prints the throughput and the p50/p95/p99 latencies per endpoint as JSON.
+
+Usage (from the src folder):
+    python -m benchmarks.loadtest --concurrency 16 --duration 30
+    python -m benchmarks.loadtest --database-url postgresql://localhost/bench
+'''
+import os
+import sys
+import argparse
+import base64
+import http.client
+import json
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+
+AUDIENCE = 'casting-agency'
+DOMAIN = 'loadtest.local'
+KEY_ID = 'loadtest'
+
+ROLES = {
+    'assistant': ['get:actors', 'get:movies'],
+    'director': [
+        'get:actors', 'get:movies', 'post:actors', 'delete:actors',
+        'patch:actors', 'patch:movies'],
+    'producer': [
+        'get:actors', 'get:movies', 'post:actors', 'delete:actors',
+        'patch:actors', 'patch:movies', 'post:movies', 'delete:movies']
+}
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+'''
+Tokens
+'''
+
+
+def _b64_int(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def generate_key():
+    '''
+    generate_key()
+    Returns a new RSA private key in PEM format and its JWKS document
+    '''
+    key = RSA.generate(2048)
+    jwks = {'keys': [{
+        'kty': 'RSA',
+        'kid': KEY_ID,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': _b64_int(key.n),
+        'e': _b64_int(key.e)
+    }]}
+
+    return key.exportKey('PEM').decode('ascii'), jwks
+
+
+def mint_token(private_key, role, lifetime=86400):
+    '''
+    mint_token(private_key, role, lifetime=86400)
+    Signs a token with the permissions of role, as Auth0 would issue it
+    '''
+    now = int(time.time())
+    claims = {
+        'iss': f'https://{DOMAIN}/',
+        'sub': f'loadtest|{role}',
+        'aud': AUDIENCE,
+        'iat': now,
+        'exp': now + lifetime,
+        'permissions': ROLES[role]
+    }
+
+    return jwt.encode(
+        claims, private_key, algorithm='RS256', headers={'kid': KEY_ID})
+
+
+def serve_jwks(jwks):
+    '''
+    serve_jwks(jwks)
+    Serves the JWKS document on a local port in a background thread.
+    Returns the server and the URL of the document.
+    '''
+    body = json.dumps(jwks).encode('utf-8')
+
+    class JWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    port = server.server_address[1]
+    return server, f'http://127.0.0.1:{port}/.well-known/jwks.json'
+
+
+'''
+Server
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, jwks_url, port, workers, threads=1,
+                 extra_env=None):
+    '''
+    start_server(database_url, jwks_url, port, workers, threads=1)
+    Starts gunicorn serving app:create_app() and waits until it answers.
+    Sync workers are used with one thread, threaded workers otherwise.
+    '''
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': database_url,
+        'AUTH0_DOMAIN': DOMAIN,
+        'AUTH0_JWKS_URL': jwks_url,
+        'AUTH_ALGORITHMS': 'RS256',
+        'API_AUDIENCE': AUDIENCE,
+        'DATABASE_CREATE_ALL': 'true'
+    })
+    env.update(extra_env or {})
+
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--pythonpath', SRC_DIR,
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--worker-class', 'gthread' if threads > 1 else 'sync',
+        '--bind', f'127.0.0.1:{port}',
+        '--log-level', 'warning',
+        'app:create_app()'
+    ], env=env)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with %d' % process.returncode)
+        try:
+            status, _ = request(port, 'GET', '/')
+            if status == 200:
+                return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def request(port, method, path, token=None, body=None):
+    '''
+    request(port, method, path, token=None, body=None)
+    Sends one request and returns its status and decoded JSON body
+    '''
+    headers = {}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        connection.close()
+
+    try:
+        return response.status, json.loads(data) if data else None
+    except ValueError:
+        return response.status, None
+
+
+def seed(port, token, actors, movies):
+    '''
+    seed(port, token, actors, movies)
+    Creates the initial actors and movies through the bulk endpoints
+    and returns their ids
+    '''
+    actor_ids = []
+    movie_ids = []
+
+    for start in range(0, actors, 1000):
+        status, data = request(port, 'POST', '/actors/bulk', token, [
+            {
+                'name': f'Load Actor {i}',
+                'age': 20 + i % 60,
+                'gender': 'Male' if i % 2 else 'Female'
+            }
+            for i in range(start, min(start + 1000, actors))
+        ])
+        if status != 200:
+            raise RuntimeError(f'Seeding actors failed with {status}')
+        actor_ids += [result['id'] for result in data['results']]
+
+    for start in range(0, movies, 1000):
+        status, data = request(port, 'POST', '/movies/bulk', token, [
+            {'title': f'Load Movie {i}', 'release_year': 1950 + i % 75}
+            for i in range(start, min(start + 1000, movies))
+        ])
+        if status != 200:
+            raise RuntimeError(f'Seeding movies failed with {status}')
+        movie_ids += [result['id'] for result in data['results']]
+
+    return actor_ids, movie_ids
+
+
+'''
+Workload
+'''
+
+
+def list_actors(client):
+    return client.call('assistant', 'GET', '/actors?limit=50')
+
+
+def list_movies(client):
+    return client.call('assistant', 'GET', '/movies?limit=50')
+
+
+def get_actor(client):
+    actor_id = client.rng.choice(client.actor_ids)
+    return client.call('assistant', 'GET', f'/actors/{actor_id}')
+
+
+def search(client):
+    return client.call('assistant', 'GET', '/search?q=Load+Actor+1')
+
+
+def create_actor(client):
+    return client.call('director', 'POST', '/actors', {
+        'name': 'Load Actor New',
+        'age': client.rng.randint(18, 90),
+        'gender': 'Female'
+    })
+
+
+def update_actor(client):
+    actor_id = client.rng.choice(client.actor_ids)
+    return client.call('director', 'PATCH', f'/actors/{actor_id}', {
+        'age': client.rng.randint(18, 90)
+    })
+
+
+def create_movie(client):
+    return client.call('producer', 'POST', '/movies', {
+        'title': 'Load Movie New',
+        'release_year': client.rng.randint(1950, 2025)
+    })
+
+
+# (weight, endpoint name, operation)
+WORKLOADS = {
+    'mixed': [
+        (40, 'GET /actors', list_actors),
+        (20, 'GET /movies', list_movies),
+        (20, 'GET /actors/<id>', get_actor),
+        (5, 'GET /search', search),
+        (5, 'POST /actors', create_actor),
+        (8, 'PATCH /actors/<id>', update_actor),
+        (2, 'POST /movies', create_movie)
+    ],
+    'read': [
+        (50, 'GET /actors', list_actors),
+        (20, 'GET /movies', list_movies),
+        (25, 'GET /actors/<id>', get_actor),
+        (5, 'GET /search', search)
+    ],
+    'write': [
+        (45, 'POST /actors', create_actor),
+        (45, 'PATCH /actors/<id>', update_actor),
+        (10, 'POST /movies', create_movie)
+    ]
+}
+
+
+class Client:
+    '''
+    Client
+    One simulated user, sending its requests one after the other
+    '''
+
+    def __init__(self, port, tokens, actor_ids, seed):
+        self.port = port
+        self.tokens = tokens
+        self.actor_ids = actor_ids
+        self.rng = random.Random(seed)
+
+    def call(self, role, method, path, body=None):
+        status, _ = request(self.port, method, path, self.tokens[role], body)
+        return status
+
+
+def run_workload(port, tokens, actor_ids, workload, concurrency,
+                 duration, seed=0):
+    '''
+    run_workload(port, tokens, actor_ids, workload, concurrency, duration)
+    Runs concurrency clients for duration seconds.
+    Returns the latencies and errors per endpoint, and the elapsed time.
+    '''
+    weights = [weight for weight, _, _ in workload]
+    latencies = {name: [] for _, name, _ in workload}
+    errors = {name: 0 for _, name, _ in workload}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def run(client):
+        while time.monotonic() < deadline:
+            _, name, operation = client.rng.choices(workload, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = operation(client) < 400
+            except OSError:
+                ok = False
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    threads = [
+        threading.Thread(
+            target=run, args=(Client(port, tokens, actor_ids, seed + i),))
+        for i in range(concurrency)
+    ]
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors, time.monotonic() - start
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, int(round(fraction * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(values, error_count, elapsed):
+    values = sorted(values)
+    return {
+        'requests': len(values),
+        'errors': error_count,
+        'throughput': round(len(values) / elapsed, 1),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2)
+        if values else None,
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2)
+        if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2)
+        if values else None
+    }
+
+
+def report(latencies, errors, elapsed, config):
+    '''
+    report(latencies, errors, elapsed, config)
+    Builds the JSON report of a run
+    '''
+    all_latencies = [value for values in latencies.values()
+                     for value in values]
+
+    return {
+        'config': config,
+        'elapsed_seconds': round(elapsed, 2),
+        'total': summarize(all_latencies, sum(errors.values()), elapsed),
+        'endpoints': {
+            name: summarize(values, errors[name], elapsed)
+            for name, values in latencies.items()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-url')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument(
+        '--workload', choices=sorted(WORKLOADS), default='mixed')
+    parser.add_argument('--actors', type=int, default=10000)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report to a file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or (
+            'sqlite:///' + os.path.join(directory, 'loadtest.db'))
+
+        private_key, jwks = generate_key()
+        tokens = {role: mint_token(private_key, role) for role in ROLES}
+        jwks_server, jwks_url = serve_jwks(jwks)
+
+        port = free_port()
+        server = start_server(
+            database_url, jwks_url, port, args.workers, args.threads)
+
+        try:
+            actor_ids, _ = seed(
+                port, tokens['producer'], args.actors, args.movies)
+            latencies, errors, elapsed = run_workload(
+                port, tokens, actor_ids, WORKLOADS[args.workload],
+                args.concurrency, args.duration, args.seed)
+        finally:
+            server.terminate()
+            server.wait()
+            jwks_server.shutdown()
+
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ('output', 'database_url')
+    }
+    config['database'] = database_url.split(':', 1)[0]
+    result = json.dumps(
+        report(latencies, errors, elapsed, config), indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(result + '\n')
+    else:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
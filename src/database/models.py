@@ -1,39 +1,232 @@
 import os
 import json
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+from sqlalchemy import Column, String, Integer, Index, ForeignKey, exc
+from sqlalchemy import insert, update, delete, select, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import relationship
+
+from .pool import engine_options
+from .routing import RoutingSQLAlchemy, setup_replicas
+from .search import setup_search_ddl
 
 database_path = os.environ['DATABASE_URL']
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+# Creates the missing tables when the app starts. The schema is otherwise
+# left to the migrations, so starting the app does not touch the database.
+DATABASE_CREATE_ALL = os.environ.get(
+    'DATABASE_CREATE_ALL', 'false').lower() == 'true'
+
+# Rows per multi-row INSERT statement
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+# Ids per UPDATE/DELETE ... WHERE id IN (...) statement
+BULK_ID_CHUNK_SIZE = int(os.environ.get('BULK_ID_CHUNK_SIZE', 10000))
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path,
+             create_all=DATABASE_CREATE_ALL):
     '''
     setup_db(app)
-    Binds a flask application and a SQLAlchemy service
+    Binds a flask application and a SQLAlchemy service.
+    No connection is opened unless create_all is set.
     '''
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
 
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if create_all:
+        db.create_all()
+
+    setup_replicas(app, os.environ.get('DATABASE_REPLICA_URLS', ''))
 
     return db
 
 
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and their ON DELETE CASCADE,
+    # when asked to on each connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+event.listen(Engine, 'connect', _enable_sqlite_foreign_keys)
+
+
+def dispose_engines(app):
+    '''
+    dispose_engines(app)
+    Drops the pooled connections of the primary and replica engines of app,
+    i.e. in a worker forked from a preloaded master so that it never
+    shares their sockets with the master or the other workers
+    '''
+    with app.app_context():
+        db.engine.dispose()
+
+    replicas = app.extensions.get('replicas')
+    if replicas is not None:
+        replicas.dispose()
+
+
+class TableVersion(db.Model):
+    '''
+    TableVersion Model
+    Holds a version per table that is bumped on every write to it,
+    used to build ETags without reading the table itself
+    '''
+    __tablename__ = 'TableVersion'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+def bump_table_version(table_name):
+    '''
+    bump_table_version(table_name)
+    Increments the version of a table in the current transaction
+    '''
+    table = TableVersion.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.name == table_name)
+        .values(version=table.c.version + 1))
+
+    if result.rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    insert(table).values(name=table_name, version=1))
+        except exc.IntegrityError:
+            bump_table_version(table_name)
+
+
+def get_table_versions(*table_names):
+    '''
+    get_table_versions(*table_names)
+    Returns the current versions of the given tables, in order
+    '''
+    versions = dict(
+        db.session.query(TableVersion.name, TableVersion.version)
+        .filter(TableVersion.name.in_(table_names)))
+
+    return tuple(versions.get(name, 0) for name in table_names)
+
+
+def bulk_insert(model, rows):
+    '''
+    bulk_insert(model, rows)
+    Inserts rows (dicts of column values) in a single transaction
+    using multi-row INSERT ... RETURNING statements where supported.
+    Returns the new ids in the same order as rows
+    '''
+    table = model.__table__
+    ids = []
+
+    if db.engine.dialect.full_returning:
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            result = db.session.execute(
+                insert(table)
+                .values(rows[start:start + BULK_CHUNK_SIZE])
+                .returning(table.c.id))
+            ids.extend(row.id for row in result)
+    else:
+        for row in rows:
+            result = db.session.execute(insert(table).values(row))
+            ids.append(result.inserted_primary_key[0])
+
+    bump_table_version(table.name)
+    db.session.commit()
+
+    return ids
+
+
+def _execute_by_ids(model, ids, make_statement):
+    '''
+    _execute_by_ids(model, ids, make_statement)
+    Runs make_statement(id_condition) for chunks of ids in a single
+    transaction. Returns the ids of the affected rows
+    '''
+    table = model.__table__
+    affected_ids = []
+
+    for start in range(0, len(ids), BULK_ID_CHUNK_SIZE):
+        condition = table.c.id.in_(ids[start:start + BULK_ID_CHUNK_SIZE])
+
+        if db.engine.dialect.full_returning:
+            result = db.session.execute(
+                make_statement(condition).returning(table.c.id))
+            affected_ids.extend(row.id for row in result)
+        else:
+            result = db.session.execute(select(table.c.id).where(condition))
+            chunk_ids = [row.id for row in result]
+            if chunk_ids:
+                db.session.execute(
+                    make_statement(table.c.id.in_(chunk_ids)))
+                affected_ids.extend(chunk_ids)
+
+    if affected_ids:
+        bump_table_version(table.name)
+    db.session.commit()
+
+    return affected_ids
+
+
+def bulk_update(model, ids, values):
+    '''
+    bulk_update(model, ids, values)
+    Sets the same column values on every row in ids with set based
+    UPDATE ... WHERE id IN (...) RETURNING id statements.
+    Returns the ids of the updated rows
+    '''
+    table = model.__table__
+    return _execute_by_ids(
+        model, ids,
+        lambda condition: update(table).where(condition).values(values))
+
+
+def bulk_delete(model, ids):
+    '''
+    bulk_delete(model, ids)
+    Deletes every row in ids with set based
+    DELETE ... WHERE id IN (...) RETURNING id statements.
+    Returns the ids of the deleted rows
+    '''
+    table = model.__table__
+    return _execute_by_ids(
+        model, ids,
+        lambda condition: delete(table).where(condition))
+
+
 class Actor(db.Model):
     '''
     Actor Model
     Has attributes  name, age and gender
     '''
     __tablename__ = 'Actor'
+    __table_args__ = (
+        Index('ix_Actor_name_id', 'name', 'id'),
+        Index('ix_Actor_age_id', 'age', 'id'),
+        Index('ix_Actor_gender_age_id', 'gender', 'age', 'id'),
+    )
+
+    # Fields returned by format(), in order
+    FIELDS = ('id', 'name', 'age', 'gender')
+    # Keys the actor list can be sorted by, each is backed by an index
+    SORT_KEYS = ('id', 'name', 'age')
 
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     age = Column(Integer, nullable=False)
     gender = Column(String(20), nullable=False)
 
+    movies = relationship(
+        'Movie', secondary='Cast', order_by='Movie.id',
+        passive_deletes=True, back_populates='actors')
+
     def __init__(self, name, age, gender):
         self.name = name
         self.age = age
@@ -41,13 +234,16 @@ class Actor(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def format(self):
@@ -68,24 +264,41 @@ class Movie(db.Model):
     Has attributes title and release year
     '''
     __tablename__ = 'Movie'
+    __table_args__ = (
+        Index('ix_Movie_title_id', 'title', 'id'),
+        Index('ix_Movie_release_year_id', 'release_year', 'id'),
+    )
+
+    # Fields returned by format(), in order
+    FIELDS = ('id', 'title', 'release_year')
+    # Keys the movie list can be sorted by, each is backed by an index
+    SORT_KEYS = ('id', 'title', 'release_year')
 
     id = Column(Integer, primary_key=True)
     title = Column(String(100), nullable=False)
     release_year = Column(Integer, nullable=False)
 
+    # The Cast rows are deleted by the database, ON DELETE CASCADE
+    actors = relationship(
+        'Actor', secondary='Cast', order_by='Actor.id',
+        passive_deletes=True, back_populates='movies')
+
     def __init__(self, title, release_year):
         self.title = title
         self.release_year = release_year
 
     def insert(self):
         db.session.add(self)
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_table_version(self.__tablename__)
         db.session.commit()
 
     def format(self):
@@ -97,3 +310,90 @@ class Movie(db.Model):
 
     def __repr__(self):
         return json.dumps(self.format())
+
+
+class Cast(db.Model):
+    '''
+    Cast Model
+    Associates a movie with an actor playing in it
+    '''
+    __tablename__ = 'Cast'
+    __table_args__ = (
+        Index('ix_Cast_actor_id_movie_id', 'actor_id', 'movie_id'),
+    )
+
+    movie_id = Column(
+        Integer, ForeignKey('Movie.id', ondelete='CASCADE'),
+        primary_key=True)
+    actor_id = Column(
+        Integer, ForeignKey('Actor.id', ondelete='CASCADE'),
+        primary_key=True)
+
+
+def add_cast(movie_id, actor_ids):
+    '''
+    add_cast(movie_id, actor_ids)
+    Adds actors to the cast of a movie in a single transaction,
+    skipping the ones already in it.
+    Returns the ids of the added actors and the ids of unknown actors
+    '''
+    table = Cast.__table__
+    actor_table = Actor.__table__
+    found_ids = set()
+    cast_ids = set()
+
+    # One statement per chunk finds the actors and whether they are cast
+    for start in range(0, len(actor_ids), BULK_ID_CHUNK_SIZE):
+        result = db.session.execute(
+            select(actor_table.c.id, table.c.actor_id)
+            .select_from(actor_table.outerjoin(table, (
+                (table.c.actor_id == actor_table.c.id)
+                & (table.c.movie_id == movie_id))))
+            .where(actor_table.c.id.in_(
+                actor_ids[start:start + BULK_ID_CHUNK_SIZE])))
+
+        for actor_id, cast_id in result:
+            found_ids.add(actor_id)
+            if cast_id is not None:
+                cast_ids.add(actor_id)
+
+    added_ids = [
+        actor_id for actor_id in actor_ids
+        if actor_id in found_ids and actor_id not in cast_ids]
+    not_found_ids = [
+        actor_id for actor_id in actor_ids if actor_id not in found_ids]
+
+    for start in range(0, len(added_ids), BULK_CHUNK_SIZE):
+        db.session.execute(insert(table).values([
+            {'movie_id': movie_id, 'actor_id': actor_id}
+            for actor_id in added_ids[start:start + BULK_CHUNK_SIZE]
+        ]))
+
+    if added_ids:
+        bump_table_version(table.name)
+    db.session.commit()
+
+    return added_ids, not_found_ids
+
+
+def remove_cast(movie_id, actor_id):
+    '''
+    remove_cast(movie_id, actor_id)
+    Removes an actor from the cast of a movie.
+    Returns whether they were in it
+    '''
+    table = Cast.__table__
+    result = db.session.execute(
+        delete(table)
+        .where(table.c.movie_id == movie_id)
+        .where(table.c.actor_id == actor_id))
+
+    if result.rowcount:
+        bump_table_version(table.name)
+    db.session.commit()
+
+    return result.rowcount > 0
+
+
+setup_search_ddl(Actor.__table__, 'name')
+setup_search_ddl(Movie.__table__, 'title')
@@ -0,0 +1,151 @@
+import os
+import bisect
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# Upper bounds in seconds of the checkout wait time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float('inf'))
+
+
+def engine_options(database_path):
+    '''
+    engine_options(database_path)
+    Returns the SQLAlchemy engine options for the database,
+    read from the environment:
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+        DB_POOL_RECYCLE and DB_POOL_PRE_PING
+    SQLite keeps SQLAlchemy's default pool.
+    '''
+    if make_url(database_path).get_backend_name() == 'sqlite':
+        return {}
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping':
+            os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+
+
+class PoolStats:
+    '''
+    PoolStats
+    Thread safe counters of a connection pool
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+        self.wait_sum = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        index = bisect.bisect_left(WAIT_BUCKETS, seconds)
+        with self._lock:
+            self.wait_buckets[index] += 1
+            self.wait_sum += seconds
+            if timed_out:
+                self.checkout_timeouts += 1
+            else:
+                self.checkouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(WAIT_BUCKETS, self.wait_buckets):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = (
+                    cumulative)
+
+            return {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'wait_seconds': {
+                    'buckets': buckets,
+                    'count': cumulative,
+                    'sum': self.wait_sum
+                }
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    '''
+    InstrumentedQueuePool
+    QueuePool that records checkout wait times and timeouts,
+    and connects and invalidations through pool events, in self.stats
+    '''
+
+    def __init__(self, creator, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.stats = PoolStats()
+
+        # recreate() copies the listeners of the previous pool
+        if '_dispatch' not in kwargs:
+            event.listen(self, 'connect', self._on_connect)
+            event.listen(self, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.stats.record_connect()
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.stats.record_invalidation()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_wait(time.perf_counter() - start, True)
+            raise
+
+        self.stats.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_status(pool):
+    '''
+    pool_status(pool)
+    Returns the current state and the statistics of a pool
+    '''
+    status = {'class': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout()
+        })
+
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update(pool.stats.snapshot())
+
+    return status
@@ -0,0 +1,277 @@
+import os
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask import _request_ctx_stack
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from itsdangerous import BadData, URLSafeTimedSerializer
+from sqlalchemy import create_engine, event, exc, orm
+
+from .pool import engine_options
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client keeps reading from the primary after it wrote
+PRIMARY_PIN_SECONDS = float(os.environ.get('DATABASE_PRIMARY_PIN_SECONDS', 5))
+# Key signing the pin cookie, shared by the workers (default: the database
+# url, which they already share and which is never sent to clients)
+PRIMARY_PIN_SECRET = os.environ.get('DATABASE_PRIMARY_PIN_SECRET')
+# Seconds a failing replica is taken out of the rotation
+REPLICA_EJECT_SECONDS = float(
+    os.environ.get('DATABASE_REPLICA_EJECT_SECONDS', 30))
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaSet:
+    '''
+    ReplicaSet
+    Round-robin over read replica engines.
+    A replica raising a connection error is ejected for eject_seconds.
+    '''
+
+    def __init__(self, urls, secret, eject_seconds=REPLICA_EJECT_SECONDS):
+        self.eject_seconds = eject_seconds
+        self.pins = PrimaryPins()
+        self.pin_cookie = PrimaryPinCookie(secret)
+        self.engines = []
+        self._ejected_until = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+        for url in urls:
+            engine = create_engine(url, **engine_options(url))
+            event.listen(engine, 'handle_error', self._on_error)
+            self.engines.append(engine)
+
+    def choose(self):
+        '''
+        choose()
+        Returns the next healthy replica engine, or None if there is none
+        '''
+        now = time.monotonic()
+
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next]
+                self._next = (self._next + 1) % len(self.engines)
+
+                if self._ejected_until.get(engine, 0) <= now:
+                    return engine
+
+        return None
+
+    def eject(self, engine):
+        logger.warning('Ejecting read replica %r', engine.url)
+        with self._lock:
+            self._ejected_until[engine] = (
+                time.monotonic() + self.eject_seconds)
+
+    def _on_error(self, context):
+        if (
+            context.is_disconnect
+            or isinstance(context.original_exception, exc.OperationalError)
+            or isinstance(context.sqlalchemy_exception, exc.OperationalError)
+        ):
+            self.eject(context.engine)
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+class PrimaryPins:
+    '''
+    PrimaryPins
+    Remembers, per client, until when its reads should go to the primary
+    so that a client reads its own writes.
+    The pins are kept in memory and are local to the worker process,
+    and shared by its threads. PrimaryPinCookie carries them to the other
+    processes.
+    '''
+
+    def __init__(self, seconds=PRIMARY_PIN_SECONDS, max_size=10000):
+        self.seconds = seconds
+        self.max_size = max_size
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def pin(self, subject):
+        now = time.monotonic()
+
+        with self._lock:
+            if len(self._until) >= self.max_size:
+                self._until = {
+                    key: until for key, until in self._until.items()
+                    if until > now
+                }
+
+            self._until[subject] = now + self.seconds
+
+    def is_pinned(self, subject):
+        return self._until.get(subject, 0) > time.monotonic()
+
+
+class PrimaryPinCookie:
+    '''
+    PrimaryPinCookie
+    Carries the pin of a client in a signed cookie holding its subject and
+    the time of its write, so that the reads of the client go to the
+    primary whichever worker process serves them
+    '''
+
+    name = 'primary_pin'
+
+    def __init__(self, secret, seconds=PRIMARY_PIN_SECONDS):
+        self.seconds = seconds
+        self._serializer = URLSafeTimedSerializer(secret, salt=self.name)
+
+    def dumps(self, subject):
+        return self._serializer.dumps(subject)
+
+    def is_pinned(self, subject, value):
+        if not value:
+            return False
+
+        try:
+            return self._serializer.loads(
+                value, max_age=self.seconds) == subject
+        except BadData:
+            return False
+
+    def set(self, response, subject):
+        response.set_cookie(
+            self.name, self.dumps(subject),
+            max_age=max(1, round(self.seconds)),
+            httponly=True, samesite='Lax')
+
+
+def is_pinned(replicas, subject):
+    '''
+    is_pinned(replicas, subject)
+    Returns whether the reads of subject should go to the primary, pinned
+    by this worker or by the cookie of the request
+    '''
+    if subject is None:
+        return False
+
+    return replicas.pins.is_pinned(subject) or replicas.pin_cookie.is_pinned(
+        subject, request.cookies.get(replicas.pin_cookie.name))
+
+
+def current_subject():
+    '''
+    current_subject()
+    Returns the `sub` claim of the authenticated request, or None
+    '''
+    payload = getattr(_request_ctx_stack.top, 'current_user', None)
+    return payload.get('sub') if payload else None
+
+
+class RoutingSession(SignallingSession):
+    '''
+    RoutingSession
+    Sends the reads of read-only requests to a replica. Writes, reads of
+    other requests and reads of a client that just wrote use the primary.
+    A read failing on its replica with an OperationalError is retried
+    once on the primary.
+    '''
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self._replica = None
+        self._wrote = False
+        self._replica_failed = False
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.extensions.get('replicas')
+        primary = super().get_bind(mapper, clause)
+
+        if replicas is None or not has_request_context():
+            return primary
+
+        subject = current_subject()
+
+        if self._flushing or (clause is not None and clause.is_dml):
+            self._wrote = True
+            if subject is not None:
+                replicas.pins.pin(subject)
+                g.primary_pin_subject = subject
+            return primary
+
+        if (
+            self._wrote
+            or self._replica_failed
+            or request.method not in READ_ONLY_METHODS
+            or is_pinned(replicas, subject)
+        ):
+            return primary
+
+        if self._replica is None:
+            self._replica = replicas.choose() or primary
+
+        return self._replica
+
+    def execute(self, *args, **kwargs):
+        try:
+            return super().execute(*args, **kwargs)
+        except exc.OperationalError:
+            replicas = self.app.extensions.get('replicas')
+            if (
+                replicas is None
+                or self._wrote
+                or self._replica_failed
+                or self._replica not in replicas.engines
+            ):
+                raise
+
+            # The replica was ejected by ReplicaSet._on_error
+            logger.warning('Retrying a failed replica read on the primary')
+            self.rollback()
+            self._replica_failed = True
+            return super().execute(*args, **kwargs)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''
+    RoutingSQLAlchemy
+    SQLAlchemy service whose sessions route reads to read replicas
+    '''
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def setup_replicas(app, replica_urls):
+    '''
+    setup_replicas(app, replica_urls)
+    Registers the read replicas of an application.
+    replica_urls is a comma separated list of database urls
+    '''
+    urls = [url.strip() for url in replica_urls.split(',') if url.strip()]
+
+    if not urls:
+        app.extensions.pop('replicas', None)
+        return None
+
+    replicas = ReplicaSet(
+        urls, PRIMARY_PIN_SECRET or app.config['SQLALCHEMY_DATABASE_URI'])
+    app.extensions['replicas'] = replicas
+
+    if _set_pin_cookie not in app.after_request_funcs.get(None, []):
+        app.after_request(_set_pin_cookie)
+
+    return replicas
+
+
+def _set_pin_cookie(response):
+    # Pins the client that wrote in this request in every worker
+    replicas = current_app.extensions.get('replicas')
+    subject = g.get('primary_pin_subject')
+
+    if replicas is not None and subject is not None:
+        replicas.pin_cookie.set(response, subject)
+
+    return response
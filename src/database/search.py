@@ -0,0 +1,135 @@
+from sqlalchemy import DDL, event, func, or_, select
+from sqlalchemy import column as sql_column, literal_column, table as sql_table
+
+
+# PostgreSQL uses pg_trgm GIN indexes, searched with ILIKE and the
+# word similarity operator and ranked by word_similarity().
+# SQLite uses an external content FTS5 table with the trigram tokenizer,
+# kept in sync by triggers and ranked by bm25.
+
+POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_{column}_trgm" '
+    'ON "{table}" USING gin ({column} gin_trgm_ops)'
+]
+
+SQLITE_DDL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "{table}_search" USING fts5('
+    '{column}, content=\'{table}\', content_rowid=\'id\', '
+    'tokenize=\'trigram\')',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_insert" '
+    'AFTER INSERT ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"(rowid, {column}) '
+    'VALUES (new.id, new.{column}); END',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_delete" '
+    'AFTER DELETE ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"("{table}_search", rowid, {column}) '
+    'VALUES (\'delete\', old.id, old.{column}); END',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_update" '
+    'AFTER UPDATE OF {column} ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"("{table}_search", rowid, {column}) '
+    'VALUES (\'delete\', old.id, old.{column}); '
+    'INSERT INTO "{table}_search"(rowid, {column}) '
+    'VALUES (new.id, new.{column}); END',
+
+    'INSERT INTO "{table}_search"("{table}_search") VALUES (\'rebuild\')'
+]
+
+POSTGRES_DROP_DDL = ['DROP INDEX IF EXISTS "ix_{table}_{column}_trgm"']
+
+SQLITE_DROP_DDL = [
+    'DROP TRIGGER IF EXISTS "{table}_search_insert"',
+    'DROP TRIGGER IF EXISTS "{table}_search_delete"',
+    'DROP TRIGGER IF EXISTS "{table}_search_update"',
+    'DROP TABLE IF EXISTS "{table}_search"'
+]
+
+
+def search_ddl(dialect_name, table_name, column_name, drop=False):
+    '''
+    search_ddl(dialect_name, table_name, column_name)
+    Returns the statements creating (or dropping) the search index
+    of a column for the given dialect
+    '''
+    if dialect_name == 'postgresql':
+        statements = POSTGRES_DROP_DDL if drop else POSTGRES_DDL
+    elif dialect_name == 'sqlite':
+        statements = SQLITE_DROP_DDL if drop else SQLITE_DDL
+    else:
+        statements = []
+
+    return [
+        statement.format(table=table_name, column=column_name)
+        for statement in statements
+    ]
+
+
+def setup_search_ddl(table, column_name):
+    '''
+    setup_search_ddl(table, column_name)
+    Creates the search index of a column together with its table
+    when the schema is created with create_all
+    '''
+    for dialect_name in ('postgresql', 'sqlite'):
+        for statement in search_ddl(dialect_name, table.name, column_name):
+            event.listen(
+                table, 'after_create',
+                DDL(statement).execute_if(dialect=dialect_name))
+
+        for statement in search_ddl(
+            dialect_name, table.name, column_name, drop=True
+        ):
+            event.listen(
+                table, 'before_drop',
+                DDL(statement).execute_if(dialect=dialect_name))
+
+
+def search_query(model, column_name, fields, search_text, dialect_name):
+    '''
+    search_query(model, column_name, fields, search_text, dialect_name)
+    Returns a select of the model fields matching search_text,
+    best matches first
+    '''
+    table = model.__table__
+    column = table.c[column_name]
+    columns = [table.c[field] for field in fields]
+
+    if dialect_name == 'sqlite':
+        search_table = sql_table(
+            f'{table.name}_search', sql_column('rowid'), sql_column('rank'))
+        match = '"' + search_text.replace('"', '""') + '"'
+        return (
+            select(*columns)
+            .select_from(table.join(
+                search_table, search_table.c.rowid == table.c.id))
+            .where(literal_column(f'"{table.name}_search"').op('MATCH')(match))
+            .order_by(search_table.c.rank, table.c.id)
+        )
+
+    pattern = '%' + (
+        search_text
+        .replace('\\', '\\\\')
+        .replace('%', '\\%')
+        .replace('_', '\\_')
+    ) + '%'
+
+    if dialect_name == 'postgresql':
+        return (
+            select(*columns)
+            .where(or_(
+                column.ilike(pattern, escape='\\'),
+                column.op('%>')(search_text)
+            ))
+            .order_by(
+                func.word_similarity(search_text, column).desc(),
+                table.c.id)
+        )
+
+    return (
+        select(*columns)
+        .where(column.ilike(pattern, escape='\\'))
+        .order_by(table.c.id)
+    )
@@ -0,0 +1,179 @@
+import os
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, exc, func
+from sqlalchemy import delete, insert
+
+from .models import db, Actor, Movie, bump_table_version, get_table_versions
+
+
+# live runs the GROUP BY queries on every request, summary reads their
+# results from the StatsSummary table
+STATS_MODE = os.environ.get('STATS_MODE', 'live')
+# Width in years of the buckets of the actor age histogram
+STATS_AGE_BUCKET = int(os.environ.get('STATS_AGE_BUCKET', 10))
+# In summary mode, a request refreshes the summary if it is older than this
+# many seconds and the tables changed since. 0, the default, leaves the
+# refresh to the `flask refresh-stats` command, run on a schedule.
+STATS_MAX_AGE = float(os.environ.get('STATS_MAX_AGE', 0))
+
+STATS_TABLES = ('Actor', 'Movie')
+
+
+class StatsSummary(db.Model):
+    '''
+    StatsSummary Model
+    Holds the aggregates of the last refresh_stats() as
+    (metric, bucket, count) rows, and the table versions they were
+    computed from under the table_version metric
+    '''
+    __tablename__ = 'StatsSummary'
+
+    metric = Column(String(50), primary_key=True)
+    bucket = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False)
+
+
+def compute_stats():
+    '''
+    compute_stats()
+    Returns the aggregates of the actors and movies as
+    (metric, bucket, count) rows, computed by the database with GROUP BY
+    '''
+    age_bucket = (Actor.age / STATS_AGE_BUCKET) * STATS_AGE_BUCKET
+    queries = [
+        ('actors_by_gender', db.session.query(
+            Actor.gender, func.count()).group_by(Actor.gender)),
+        ('actors_by_age', db.session.query(
+            age_bucket, func.count()).group_by(age_bucket)),
+        ('movies_by_release_year', db.session.query(
+            Movie.release_year, func.count()).group_by(Movie.release_year))
+    ]
+
+    return [
+        (metric, str(bucket), count)
+        for metric, query in queries
+        for bucket, count in query
+    ]
+
+
+def refresh_stats():
+    '''
+    refresh_stats()
+    Replaces the StatsSummary rows with freshly computed aggregates
+    in a single transaction. A concurrent refresh wins over this one.
+    '''
+    # Read before the data, so the summary can only look older than it is
+    versions = get_table_versions(*STATS_TABLES)
+    rows = compute_stats()
+    rows.extend(
+        ('table_version', name, version)
+        for name, version in zip(STATS_TABLES, versions))
+
+    refreshed_at = datetime.utcnow()
+    table = StatsSummary.__table__
+
+    try:
+        db.session.execute(delete(table))
+        db.session.execute(insert(table).values([
+            {'metric': metric, 'bucket': bucket, 'count': count,
+             'refreshed_at': refreshed_at}
+            for metric, bucket, count in rows
+        ]))
+        bump_table_version(table.name)
+        db.session.commit()
+    except exc.IntegrityError:
+        db.session.rollback()
+
+
+def _read_summary():
+    return db.session.query(
+        StatsSummary.metric, StatsSummary.bucket,
+        StatsSummary.count, StatsSummary.refreshed_at).all()
+
+
+def _is_stale(rows, max_age):
+    if not rows:
+        return True
+
+    age = (datetime.utcnow() - rows[0].refreshed_at).total_seconds()
+    if not max_age or age < max_age:
+        return False
+
+    versions = {
+        row.bucket: row.count for row in rows
+        if row.metric == 'table_version'
+    }
+    return get_table_versions(*STATS_TABLES) != tuple(
+        versions.get(name, 0) for name in STATS_TABLES)
+
+
+def format_stats(rows):
+    '''
+    format_stats(rows)
+    Builds the /stats response from (metric, bucket, count) rows
+    '''
+    metrics = {}
+    for metric, bucket, count in rows:
+        metrics.setdefault(metric, []).append((bucket, count))
+
+    by_gender = sorted(metrics.get('actors_by_gender', []))
+    by_age = sorted(
+        (int(bucket), count)
+        for bucket, count in metrics.get('actors_by_age', []))
+    by_year = sorted(
+        (int(bucket), count)
+        for bucket, count in metrics.get('movies_by_release_year', []))
+
+    return {
+        'actors': {
+            'count': sum(count for _, count in by_gender),
+            'by_gender': [
+                {'gender': gender, 'count': count}
+                for gender, count in by_gender
+            ],
+            'by_age': [
+                {'age': age, 'count': count} for age, count in by_age
+            ]
+        },
+        'movies': {
+            'count': sum(count for _, count in by_year),
+            'by_release_year': [
+                {'release_year': year, 'count': count}
+                for year, count in by_year
+            ]
+        }
+    }
+
+
+def get_stats(mode=STATS_MODE, max_age=STATS_MAX_AGE):
+    '''
+    get_stats(mode=STATS_MODE, max_age=STATS_MAX_AGE)
+    Returns the aggregates and the time of the summary they were read
+    from, which is None in live mode
+    '''
+    if mode == 'live':
+        return format_stats(compute_stats()), None
+
+    rows = _read_summary()
+    if _is_stale(rows, max_age):
+        refresh_stats()
+        rows = _read_summary()
+
+    stats = format_stats(
+        (row.metric, row.bucket, row.count) for row in rows
+        if row.metric != 'table_version')
+
+    return stats, rows[0].refreshed_at if rows else None
+
+
+def setup_stats(app, mode=STATS_MODE):
+    '''
+    setup_stats(app, mode=STATS_MODE)
+    Sets how the /stats endpoint of app computes the aggregates:
+    live or summary
+    '''
+    if mode not in ('live', 'summary'):
+        raise ValueError(f'Unknown STATS_MODE {mode!r}.')
+
+    app.extensions['stats_mode'] = mode
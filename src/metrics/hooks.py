@@ -0,0 +1,238 @@
+import os
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .registry import MetricsRegistry, write_snapshot, read_snapshots
+from .registry import compact_snapshots, merge_snapshots, render_prometheus
+from .queries import QueryLog
+
+
+logger = logging.getLogger(__name__)
+
+
+# Directory shared by the gunicorn workers, each worker writes its metrics
+# to its own file and /metrics sums them. Only the local process is
+# exported when it is not set.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# Minimum seconds between two writes of the metrics file of a worker
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+REGISTRY = MetricsRegistry()
+
+_process = {
+    'pid': None, 'name': None, 'flushed_at': 0.0, 'first_request_pid': None}
+_first_request_lock = threading.Lock()
+
+
+def record_phase(phase, seconds):
+    '''
+    record_phase(phase, seconds)
+    Adds time spent in a phase to the current request.
+    Outside of a request (i.e. a background JWKS refresh) it is recorded
+    under the `-` endpoint.
+    '''
+    if has_request_context():
+        phases = g.setdefault('_metrics_phases', {})
+        phases[phase] = phases.get(phase, 0.0) + seconds
+    else:
+        REGISTRY.observe(
+            'http_request_phase_seconds',
+            {'endpoint': '-', 'phase': phase}, seconds)
+
+
+def record_startup(phase, seconds):
+    '''
+    record_startup(phase, seconds)
+    Records the time a process spent starting in a phase:
+    create_app, or first_request for the first request it served
+    '''
+    REGISTRY.observe('app_startup_seconds', {'phase': phase}, seconds)
+
+
+def forget_inherited_startup():
+    '''
+    forget_inherited_startup()
+    Drops the create_app time a worker forked from a preloaded master
+    inherited, so only one worker reports it
+    '''
+    REGISTRY.discard('app_startup_seconds', {'phase': 'create_app'})
+
+
+def _is_first_request():
+    # Checked by pid, a worker forked from a preloaded master starts over
+    pid = os.getpid()
+    with _first_request_lock:
+        if _process['first_request_pid'] == pid:
+            return False
+        _process['first_request_pid'] = pid
+        return True
+
+
+@contextmanager
+def timed_phase(phase):
+    '''
+    timed_phase(phase)
+    Context manager recording the time spent in its block with record_phase
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters,
+                           context, executemany):
+    # Kept on the execution context, which is dropped with the statement
+    # when it fails and after_cursor_execute is never called
+    context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters,
+                          context, executemany):
+    start = getattr(context, '_metrics_query_start', None)
+    if start is None:
+        return
+
+    seconds = time.perf_counter() - start
+    record_phase('query', seconds)
+
+    if has_request_context():
+        query_log = g.setdefault('_metrics_query_log', QueryLog())
+    else:
+        query_log = QueryLog()
+
+    query_log.record(statement, parameters, seconds, executemany)
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+
+    endpoint = _endpoint()
+    labels = {'endpoint': endpoint, 'method': request.method}
+
+    REGISTRY.inc('http_requests_total', labels)
+    REGISTRY.inc(
+        'http_responses_total',
+        dict(labels, status=str(response.status_code)))
+    duration = time.perf_counter() - start
+    REGISTRY.observe('http_request_duration_seconds', labels, duration)
+    if _is_first_request():
+        record_startup('first_request', duration)
+
+    for phase, seconds in g.pop('_metrics_phases', {}).items():
+        REGISTRY.observe(
+            'http_request_phase_seconds',
+            {'endpoint': endpoint, 'phase': phase}, seconds)
+
+    query_log = g.pop('_metrics_query_log', None)
+    if query_log is not None:
+        _record_queries(endpoint, query_log)
+
+    flush_metrics()
+    return response
+
+
+def _record_queries(endpoint, query_log):
+    labels = {'endpoint': endpoint}
+    REGISTRY.inc('db_queries_total', labels, query_log.count)
+    if query_log.slow:
+        REGISTRY.inc('db_slow_queries_total', labels, query_log.slow)
+
+    logger.debug(
+        '%s %s ran %d SQL statements in %.1f ms', request.method, endpoint,
+        query_log.count, query_log.seconds * 1000)
+
+    for statement, count in query_log.repeated().items():
+        REGISTRY.inc('db_repeated_queries_total', labels)
+        logger.warning(
+            'Likely N+1 query on %s, run %d times: %s',
+            endpoint, count, statement)
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is not None and query_log.count > budget:
+        REGISTRY.inc('db_query_budget_exceeded_total', labels)
+        logger.warning(
+            '%s %s ran %d SQL statements, over its budget of %d',
+            request.method, endpoint, query_log.count, budget)
+
+
+def _process_name():
+    # The pid alone is not unique, a restarted worker may reuse it and
+    # overwrite the counters of the exited one
+    pid = os.getpid()
+    if _process['pid'] != pid:
+        _process['pid'] = pid
+        _process['name'] = f'{pid}_{time.time_ns()}'
+
+    return _process['name']
+
+
+def flush_metrics(force=False):
+    '''
+    flush_metrics(force=False)
+    Writes the metrics of this process to METRICS_DIR,
+    at most every METRICS_FLUSH_INTERVAL seconds unless forced
+    '''
+    if not METRICS_DIR:
+        return
+
+    now = time.monotonic()
+    if not force and now - _process['flushed_at'] < METRICS_FLUSH_INTERVAL:
+        return
+
+    _process['flushed_at'] = now
+    write_snapshot(METRICS_DIR, REGISTRY.snapshot(), _process_name())
+
+
+atexit.register(flush_metrics, True)
+
+
+def export_metrics():
+    '''
+    export_metrics()
+    Returns the metrics of every worker in the Prometheus text format
+    '''
+    if METRICS_DIR:
+        flush_metrics(force=True)
+        compact_snapshots(METRICS_DIR)
+        snapshots = read_snapshots(METRICS_DIR)
+    else:
+        snapshots = [REGISTRY.snapshot()]
+
+    return render_prometheus(*merge_snapshots(snapshots))
+
+
+def setup_metrics(app):
+    '''
+    setup_metrics(app)
+    Records the requests of app and the queries of every engine
+    '''
+    if not event.contains(
+        Engine, 'before_cursor_execute', _before_cursor_execute
+    ):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,122 @@
+import os
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this many seconds are logged with their parameters
+SLOW_QUERY_SECONDS = float(os.environ.get('DB_SLOW_QUERY_SECONDS', 0.5))
+# A SELECT run this many times by one request is logged as a likely N+1
+REPEATED_QUERY_THRESHOLD = int(
+    os.environ.get('DB_REPEATED_QUERY_THRESHOLD', 5))
+
+
+def parameters_shape(parameters, executemany=False):
+    '''
+    parameters_shape(parameters, executemany=False)
+    Describes the parameters of a statement by their types, never their
+    values, i.e. (int, str) or {'name': str} or 500 x (int, str)
+    '''
+    if executemany:
+        parameters = list(parameters)
+        if not parameters:
+            return '0 x ()'
+        return f'{len(parameters)} x {parameters_shape(parameters[0])}'
+
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(
+            f'{key!r}: {type(value).__name__}'
+            for key, value in parameters.items()) + '}'
+
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(
+            type(value).__name__ for value in parameters) + ')'
+
+    return type(parameters).__name__
+
+
+class QueryLog:
+    '''
+    QueryLog
+    Statements executed by one request: their count, total time and the
+    number of times each distinct statement ran
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = 0
+        self.statements = Counter()
+
+    def record(self, statement, parameters, seconds, executemany=False):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+        if seconds >= SLOW_QUERY_SECONDS:
+            self.slow += 1
+            logger.warning(
+                'Slow query (%.1f ms): %s parameters=%s',
+                seconds * 1000, statement,
+                parameters_shape(parameters, executemany))
+
+    def repeated(self, threshold=REPEATED_QUERY_THRESHOLD):
+        '''
+        repeated(threshold=REPEATED_QUERY_THRESHOLD)
+        Returns the SELECT statements run at least threshold times,
+        the usual sign of a query issued once per row (N+1)
+        '''
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= threshold
+            and statement.lstrip().upper().startswith('SELECT')
+        }
+
+
+def query_budget(budget):
+    '''
+    @query_budget(budget) decorator
+        it should declare the most SQL statements a route may run,
+        a request running more is logged and counted in the metrics
+    '''
+    def query_budget_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            return f(*args, **kwargs)
+
+        wrapper.query_budget = budget
+        return wrapper
+    return query_budget_decorator
+
+
+@contextmanager
+def count_queries():
+    '''
+    count_queries()
+    Context manager collecting in a QueryLog the statements run by every
+    engine in its block, i.e. to check a query budget in the tests
+    '''
+    query_log = QueryLog()
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._count_queries_start = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        query_log.record(
+            statement, parameters,
+            time.perf_counter() - context._count_queries_start, executemany)
+
+    event.listen(Engine, 'before_cursor_execute', before)
+    event.listen(Engine, 'after_cursor_execute', after)
+    try:
+        yield query_log
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before)
+        event.remove(Engine, 'after_cursor_execute', after)
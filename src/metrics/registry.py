@@ -0,0 +1,320 @@
+import os
+import bisect
+import fcntl
+import json
+import glob
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# File holding the sum of the metrics of the exited processes
+EXITED_SNAPSHOT = 'metrics_exited.json'
+
+METRIC_HELP = {
+    'http_requests_total': ('counter', 'Requests by endpoint and method.'),
+    'http_responses_total': (
+        'counter', 'Responses by endpoint, method and status code.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by endpoint and method.'),
+    'http_request_phase_seconds': (
+        'histogram',
+        'Time spent per request in the jwks_fetch, jwt_decode, query, '
+        'serialization and compression phases, by endpoint.'),
+    'app_startup_seconds': (
+        'histogram',
+        'Time a process spent in create_app and serving its first request.'),
+    'db_queries_total': ('counter', 'SQL statements executed by endpoint.'),
+    'db_slow_queries_total': (
+        'counter', 'SQL statements over DB_SLOW_QUERY_SECONDS by endpoint.'),
+    'db_repeated_queries_total': (
+        'counter',
+        'SELECT statements repeated by one request (likely N+1) by endpoint.'),
+    'db_query_budget_exceeded_total': (
+        'counter', 'Requests over the query budget of their route.'),
+    'token_cache_requests_total': (
+        'counter',
+        'Verified token cache lookups by hit, miss or negative_hit.'),
+    'response_cache_requests_total': (
+        'counter', 'Response cache lookups by backend and hit or miss.'),
+    'response_cache_evictions_total': (
+        'counter', 'Entries evicted from the in-process response cache.')
+}
+
+
+class MetricsRegistry:
+    '''
+    MetricsRegistry
+    Thread safe counters and histograms of one process, keyed by metric name
+    and a sorted tuple of (label, value) pairs
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0.0}
+            histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+
+    def snapshot(self):
+        '''
+        snapshot()
+        Returns the metrics as a JSON serializable dict
+        '''
+        with self._lock:
+            return {
+                'counters': [
+                    [name, list(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                'histograms': [
+                    [name, list(labels), list(histogram['buckets']),
+                     histogram['sum']]
+                    for (name, labels), histogram in self._histograms.items()
+                ]
+            }
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def discard(self, name, labels):
+        '''
+        discard(name, labels)
+        Removes the counter or histogram name with the given labels
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters.pop(key, None)
+            self._histograms.pop(key, None)
+
+
+def write_snapshot(directory, snapshot, process_name):
+    '''
+    write_snapshot(directory, snapshot, process_name)
+    Atomically replaces the metrics file of a process in directory
+    '''
+    path = os.path.join(directory, f'metrics_{process_name}.json')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    with os.fdopen(fd, 'w') as tmp_file:
+        json.dump(snapshot, tmp_file)
+
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _directory_lock(directory, operation):
+    with open(os.path.join(directory, 'metrics.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_snapshot(path):
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_pid(path):
+    # Process files are named metrics_<pid>_<start time>.json
+    name = os.path.basename(path)[len('metrics_'):-len('.json')]
+    try:
+        return int(name.split('_')[0])
+    except ValueError:
+        return None
+
+
+def process_alive(pid):
+    '''
+    process_alive(pid)
+    Returns whether a process with this pid is running
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def read_snapshots(directory):
+    '''
+    read_snapshots(directory)
+    Returns the metrics snapshots written by every process, including the
+    sum of the exited ones, so counters never go backwards.
+    '''
+    snapshots = []
+
+    with _directory_lock(directory, fcntl.LOCK_SH):
+        paths = glob.glob(os.path.join(directory, 'metrics_*.json'))
+        exited = _load_snapshot(os.path.join(directory, EXITED_SNAPSHOT))
+        merged = set(exited.get('merged', [])) if exited else set()
+
+        for path in paths:
+            # Already counted in the exited file but not deleted yet
+            if os.path.basename(path) in merged:
+                continue
+
+            snapshot = _load_snapshot(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+    return snapshots
+
+
+def compact_snapshots(directory, is_alive=process_alive):
+    '''
+    compact_snapshots(directory, is_alive=process_alive)
+    Adds the files of the exited processes to the exited file and deletes
+    them, so the directory does not grow with every restarted worker
+    '''
+    exited_path = os.path.join(directory, EXITED_SNAPSHOT)
+
+    with _directory_lock(directory, fcntl.LOCK_EX):
+        exited = _load_snapshot(exited_path) or {
+            'counters': [], 'histograms': []}
+
+        # Files merged by a compaction that stopped before deleting them
+        for name in exited.pop('merged', []):
+            _remove(os.path.join(directory, name))
+
+        dead = {}
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            pid = _process_pid(path)
+            if pid is None or is_alive(pid):
+                continue
+
+            snapshot = _load_snapshot(path)
+            if snapshot is not None:
+                dead[os.path.basename(path)] = snapshot
+
+        if not dead:
+            return
+
+        counters, histograms = merge_snapshots(
+            [exited] + list(dead.values()))
+        write_snapshot(directory, {
+            'counters': [
+                [name, list(labels), value]
+                for (name, labels), value in counters.items()
+            ],
+            'histograms': [
+                [name, list(labels), buckets, total]
+                for (name, labels), (buckets, total) in histograms.items()
+            ],
+            'merged': sorted(dead)
+        }, 'exited')
+
+        for name in dead:
+            _remove(os.path.join(directory, name))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def merge_snapshots(snapshots):
+    '''
+    merge_snapshots(snapshots)
+    Sums the counters and histograms of several processes
+    '''
+    counters = {}
+    histograms = {}
+
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, buckets, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                merged_buckets, merged_total = histograms[key]
+                histograms[key] = (
+                    [a + b for a, b in zip(merged_buckets, buckets)],
+                    merged_total + total)
+            else:
+                histograms[key] = (list(buckets), total)
+
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value)
+                         .replace('\\', '\\\\')
+                         .replace('"', '\\"')
+                         .replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+def render_prometheus(counters, histograms, buckets=LATENCY_BUCKETS):
+    '''
+    render_prometheus(counters, histograms, buckets=LATENCY_BUCKETS)
+    Renders merged metrics in the Prometheus text exposition format
+    '''
+    names = sorted(set(
+        [name for name, _ in counters] + [name for name, _ in histograms]))
+    lines = []
+
+    for name in names:
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(labels, [('le', le)]), cumulative))
+
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+"""create Actor and Movie
+
+Revision ID: 1f0e4c2a8b7d
+Revises: 
+Create Date: 2026-10-19 10:02:18.417306
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f0e4c2a8b7d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def has_table(name):
+    # The tables used to be created by db.create_all() when the app
+    # started, so databases set up that way already have them
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not has_table('Actor'):
+        op.create_table(
+            'Actor',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('age', sa.Integer(), nullable=False),
+            sa.Column('gender', sa.String(length=20), nullable=False),
+            sa.PrimaryKeyConstraint('id'))
+
+    if not has_table('Movie'):
+        op.create_table(
+            'Movie',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=100), nullable=False),
+            sa.Column('release_year', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('Movie')
+    op.drop_table('Actor')
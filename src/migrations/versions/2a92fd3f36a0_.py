@@ -1,7 +1,7 @@
 """empty message
 
 Revision ID: 2a92fd3f36a0
-Revises: 
+Revises: 1f0e4c2a8b7d
 Create Date: 2021-09-30 12:10:56.524724
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '2a92fd3f36a0'
-down_revision = None
+down_revision = '1f0e4c2a8b7d'
 branch_labels = None
 depends_on = None
 
@@ -0,0 +1,82 @@
+"""add search indexes to Actor and Movie
+
+Revision ID: 4f6b2d8e0a95
+Revises: e5a09c3f71b8
+Create Date: 2026-10-18 12:40:52.377806
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6b2d8e0a95'
+down_revision = 'e5a09c3f71b8'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = [('Actor', 'name'), ('Movie', 'title')]
+
+# The DDL of database/search.py as of this revision, copied so that later
+# changes to the search module do not rewrite this migration.
+# pg_trgm GIN indexes on PostgreSQL, FTS5 tables on SQLite.
+POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_{column}_trgm" '
+    'ON "{table}" USING gin ({column} gin_trgm_ops)'
+]
+
+SQLITE_DDL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "{table}_search" USING fts5('
+    '{column}, content=\'{table}\', content_rowid=\'id\', '
+    'tokenize=\'trigram\')',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_insert" '
+    'AFTER INSERT ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"(rowid, {column}) '
+    'VALUES (new.id, new.{column}); END',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_delete" '
+    'AFTER DELETE ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"("{table}_search", rowid, {column}) '
+    'VALUES (\'delete\', old.id, old.{column}); END',
+
+    'CREATE TRIGGER IF NOT EXISTS "{table}_search_update" '
+    'AFTER UPDATE OF {column} ON "{table}" BEGIN '
+    'INSERT INTO "{table}_search"("{table}_search", rowid, {column}) '
+    'VALUES (\'delete\', old.id, old.{column}); '
+    'INSERT INTO "{table}_search"(rowid, {column}) '
+    'VALUES (new.id, new.{column}); END',
+
+    'INSERT INTO "{table}_search"("{table}_search") VALUES (\'rebuild\')'
+]
+
+POSTGRES_DROP_DDL = ['DROP INDEX IF EXISTS "ix_{table}_{column}_trgm"']
+
+SQLITE_DROP_DDL = [
+    'DROP TRIGGER IF EXISTS "{table}_search_insert"',
+    'DROP TRIGGER IF EXISTS "{table}_search_delete"',
+    'DROP TRIGGER IF EXISTS "{table}_search_update"',
+    'DROP TABLE IF EXISTS "{table}_search"'
+]
+
+SEARCH_DDL = {
+    'postgresql': (POSTGRES_DDL, POSTGRES_DROP_DDL),
+    'sqlite': (SQLITE_DDL, SQLITE_DROP_DDL)
+}
+
+
+def execute_search_ddl(drop=False):
+    create_ddl, drop_ddl = SEARCH_DDL.get(
+        op.get_bind().dialect.name, ([], []))
+
+    for table_name, column_name in SEARCH_COLUMNS:
+        for statement in drop_ddl if drop else create_ddl:
+            op.execute(statement.format(table=table_name, column=column_name))
+
+
+def upgrade():
+    execute_search_ddl()
+
+
+def downgrade():
+    execute_search_ddl(drop=True)
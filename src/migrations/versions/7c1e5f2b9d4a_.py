@@ -0,0 +1,29 @@
+"""add sort indexes to Actor and Movie
+
+Revision ID: 7c1e5f2b9d4a
+Revises: 2a92fd3f36a0
+Create Date: 2026-10-18 09:12:41.208311
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5f2b9d4a'
+down_revision = '2a92fd3f36a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Actor_name_id', 'Actor', ['name', 'id'])
+    op.create_index('ix_Actor_age_id', 'Actor', ['age', 'id'])
+    op.create_index('ix_Movie_title_id', 'Movie', ['title', 'id'])
+    op.create_index('ix_Movie_release_year_id', 'Movie', ['release_year', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Movie_release_year_id', table_name='Movie')
+    op.drop_index('ix_Movie_title_id', table_name='Movie')
+    op.drop_index('ix_Actor_age_id', table_name='Actor')
+    op.drop_index('ix_Actor_name_id', table_name='Actor')
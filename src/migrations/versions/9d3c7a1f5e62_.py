@@ -0,0 +1,37 @@
+"""add Cast association between Actor and Movie
+
+Revision ID: 9d3c7a1f5e62
+Revises: 4f6b2d8e0a95
+Create Date: 2026-10-18 19:52:14.208351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3c7a1f5e62'
+down_revision = '4f6b2d8e0a95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The primary key serves the casts of a movie,
+    # ix_Cast_actor_id_movie_id the movies of an actor
+    op.create_table(
+        'Cast',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['movie_id'], ['Movie.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(
+            ['actor_id'], ['Actor.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id'))
+    op.create_index(
+        'ix_Cast_actor_id_movie_id', 'Cast', ['actor_id', 'movie_id'])
+
+
+def downgrade():
+    op.drop_index('ix_Cast_actor_id_movie_id', table_name='Cast')
+    op.drop_table('Cast')
@@ -0,0 +1,33 @@
+"""add TableVersion for ETags
+
+Revision ID: b3d81a6e4c27
+Revises: 7c1e5f2b9d4a
+Create Date: 2026-10-18 10:03:17.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d81a6e4c27'
+down_revision = '7c1e5f2b9d4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table(
+        'TableVersion',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_version, [
+        {'name': 'Actor', 'version': 1},
+        {'name': 'Movie', 'version': 1}
+    ])
+
+
+def downgrade():
+    op.drop_table('TableVersion')
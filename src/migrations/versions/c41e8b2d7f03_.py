@@ -0,0 +1,30 @@
+"""add StatsSummary for the summary /stats mode
+
+Revision ID: c41e8b2d7f03
+Revises: 9d3c7a1f5e62
+Create Date: 2026-10-18 20:14:37.581204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e8b2d7f03'
+down_revision = '9d3c7a1f5e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'StatsSummary',
+        sa.Column('metric', sa.String(length=50), nullable=False),
+        sa.Column('bucket', sa.String(length=100), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('metric', 'bucket'))
+
+
+def downgrade():
+    op.drop_table('StatsSummary')
@@ -0,0 +1,26 @@
+"""add filter index to Actor
+
+Revision ID: e5a09c3f71b8
+Revises: b3d81a6e4c27
+Create Date: 2026-10-18 11:26:05.914372
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a09c3f71b8'
+down_revision = 'b3d81a6e4c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # gender and min_age/max_age filters, the Movie release_year filters
+    # use ix_Movie_release_year_id
+    op.create_index(
+        'ix_Actor_gender_age_id', 'Actor', ['gender', 'age', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Actor_gender_age_id', table_name='Actor')
@@ -1,10 +1,42 @@
 import os
+import csv
+import gzip
 import json
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
 import unittest
+import psycopg2
+import sqlalchemy
+from unittest import mock
+from flask import Flask, request, jsonify as flask_jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql
 
 import app
-from database.models import setup_db, Actor, Movie
+from database.models import setup_db, db, Actor, Movie, add_cast
+from api.cache import LRUCache, MemcachedCache, setup_response_cache
+from api.export import copy_to_stdout
+from api.imports import CopyLoader
+from api.filters import apply_filters, ACTOR_FILTERS, MOVIE_FILTERS
+from api.json_provider import orjson, setup_json_provider
+from api.responses import jsonify
+from api.projection import project
+from api.validation import validate_actor, validate_actor_patch
+from api.validation import validate_movie, validate_records
+from auth.auth import AuthError
+from auth.jwks import JWKSKeyStore, JWKSUnavailableError, fetch_jwks
+from auth.token_cache import TokenCache
+from database.pool import InstrumentedQueuePool, pool_status
+from database.routing import PrimaryPins
+from metrics.registry import MetricsRegistry, write_snapshot, read_snapshots
+from metrics.registry import compact_snapshots
+from metrics.queries import QueryLog, count_queries, parameters_shape
+from metrics.registry import merge_snapshots, render_prometheus
 
 
 class CastingAgencyTestCase(unittest.TestCase):
@@ -15,7 +47,7 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.app = app.create_app()
         self.client = self.app.test_client
         self.database_url = os.environ['DATABASE_URL']
-        setup_db(self.app, self.database_url)
+        setup_db(self.app, self.database_url, create_all=True)
 
         # binds the app to the current context
         with self.app.app_context():
@@ -98,6 +130,27 @@ class CastingAgencyTestCase(unittest.TestCase):
         """Executed after each test"""
         pass
 
+    def explain(self, query):
+        '''
+        Returns the query plan of a query as text,
+        with sequential scans disabled on PostgreSQL so the plan shows
+        whether an index can serve the query
+        '''
+        dialect = db.engine.dialect
+        sql = str(query.statement.compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+        with db.engine.connect() as connection, connection.begin():
+            if dialect.name == 'postgresql':
+                connection.execute(sqlalchemy.text(
+                    'SET LOCAL enable_seqscan = off'))
+                rows = connection.execute(sqlalchemy.text('EXPLAIN ' + sql))
+            else:
+                rows = connection.execute(
+                    sqlalchemy.text('EXPLAIN QUERY PLAN ' + sql))
+
+            return '\n'.join(str(row[-1]) for row in rows)
+
     '''
     Actor Endpoint Tests
     '''
@@ -114,6 +167,145 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['actors']))
 
+    def get_all_pages(self, url, key):
+        rows = []
+        next_cursor = None
+
+        while True:
+            page_url = url
+            if next_cursor:
+                page_url += '&cursor=' + next_cursor
+
+            res = self.client().get(page_url, headers=self.default_token_auth)
+            data = json.loads(res.data.decode('utf-8'))
+
+            self.assertEqual(res.status_code, 200)
+            self.assertLessEqual(len(data[key]), 2)
+            rows.extend(data[key])
+
+            next_cursor = data['next_cursor']
+            if next_cursor is None:
+                return rows
+
+    def test_get_paginated_list_of_actors(self):
+        actors = self.get_all_pages('/actors?limit=2&sort=name', 'actors')
+
+        with self.app.app_context():
+            self.assertEqual(len(actors), Actor.query.count())
+
+        self.assertEqual(
+            [(actor['name'], actor['id']) for actor in actors],
+            sorted((actor['name'], actor['id']) for actor in actors))
+
+    def test_stream_list_of_actors(self):
+        res = self.client().get(
+            '/actors?stream=true',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        with self.app.app_context():
+            self.assertEqual(
+                data['actors'],
+                [actor.format() for actor in Actor.query.order_by(Actor.id)])
+
+    def test_get_list_of_actors_sparse_fields(self):
+        res = self.client().get(
+            '/actors?fields=name',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['actors']))
+        for actor in data['actors']:
+            self.assertEqual(set(actor), {'id', 'name'})
+
+    def test_400_actors_unknown_field(self):
+        res = self.client().get(
+            '/actors?fields=name,salary',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_304_not_modified_list_of_actors(self):
+        res = self.client().get(
+            '/actors',
+            headers=self.default_token_auth)
+        etag = res.headers['ETag']
+
+        res = self.client().get(
+            '/actors',
+            headers={**self.default_token_auth, 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        self.client().post(
+            '/actors',
+            json=self.actor_test,
+            headers=self.default_token_auth)
+        res = self.client().get(
+            '/actors',
+            headers={**self.default_token_auth, 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_filtered_list_of_actors(self):
+        res = self.client().get(
+            '/actors?gender=Female&min_age=40&max_age=50&limit=500',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['actors']))
+        for actor in data['actors']:
+            self.assertEqual(actor['gender'], 'Female')
+            self.assertTrue(40 <= actor['age'] <= 50)
+
+    def test_400_actors_invalid_filter(self):
+        res = self.client().get(
+            '/actors?min_age=forty',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_400_out_of_range_filters(self):
+        for url in [
+            '/actors?min_age=99999999999999999999999',
+            '/actors?max_age=-2147483649',
+            '/movies?release_year_from=2147483648'
+        ]:
+            res = self.client().get(url, headers=self.default_token_auth)
+            data = json.loads(res.data.decode('utf-8'))
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_actor_filters_use_index(self):
+        url = '/actors?gender=Female&min_age=40&max_age=50'
+        with self.app.test_request_context(url):
+            query = apply_filters(
+                project(Actor, Actor.FIELDS), ACTOR_FILTERS, request.args)
+            plan = self.explain(query)
+
+        self.assertIn('ix_Actor_gender_age_id', plan)
+
+    def test_400_actors_unsupported_sort_key(self):
+        res = self.client().get(
+            '/actors?sort=gender',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     def test_get_actor_information(self):
         res = self.client().get(
             '/actors/1',
@@ -158,6 +350,58 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Bad Request')
 
+    def test_create_actors_in_bulk(self):
+        res = self.client().post(
+            '/actors/bulk',
+            json=[
+                self.actor_test,
+                self.actor_with_missing_attributes,
+                self.actor_with_wrong_attributes,
+                {'name': 'Emma Stone', 'age': '32', 'gender': 'Female'}
+            ],
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['created_count'], 2)
+        self.assertTrue(data['results'][0]['id'])
+        self.assertEqual(data['results'][1]['error'], 400)
+        self.assertEqual(data['results'][2]['error'], 400)
+        self.assertTrue(data['results'][3]['id'])
+
+        with self.app.app_context():
+            actor = Actor.query.get(data['results'][3]['id'])
+            self.assertEqual(actor.name, 'Emma Stone')
+            self.assertEqual(actor.age, 32)
+
+    def test_create_actors_in_bulk_with_out_of_range_ages(self):
+        res = self.client().post(
+            '/actors/bulk',
+            data='[{"name": "A", "age": Infinity, "gender": "Male"},'
+                 ' {"name": "B", "age": 1000000000000000000000000000000,'
+                 ' "gender": "Male"},'
+                 ' {"name": "C", "age": 30, "gender": "Male"}]',
+            content_type='application/json',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created_count'], 1)
+        self.assertEqual(data['results'][0]['error'], 400)
+        self.assertEqual(data['results'][1]['error'], 422)
+        self.assertTrue(data['results'][2]['id'])
+
+    def test_400_bad_request_create_actors_in_bulk_without_array(self):
+        res = self.client().post(
+            '/actors/bulk',
+            json=self.actor_test,
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     # Patch Actor
 
     def test_update_actor_information(self):
@@ -183,6 +427,28 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Unprocessable Entity')
 
+    def test_actor_create_and_update_share_rules(self):
+        actor_id, = self.create_records('/actors/bulk', [
+            {'name': 'Rules Actor', 'age': '41', 'gender': 'Male'}])
+
+        for body, status_code in [
+            ({'age': '42'}, 200),
+            ({'age': 43.0}, 200),
+            ({'age': 43.5}, 400),
+            ({'age': True}, 400),
+            ({'age': 2147483648}, 422),
+            ({'gender': 'Other'}, 422),
+            (['age', 44], 400)
+        ]:
+            res = self.client().patch(
+                f'/actors/{actor_id}', json=body,
+                headers=self.default_token_auth)
+
+            self.assertEqual(res.status_code, status_code, body)
+
+        res, data = self.get_json(f'/actors/{actor_id}')
+        self.assertEqual(data['actor']['age'], 43)
+
     # Delete Actor
 
     def test_delete_actor(self):
@@ -195,6 +461,50 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['deleted_id'])
 
+    def test_update_actors_in_bulk(self):
+        res = self.client().patch(
+            '/actors/bulk',
+            json={'ids': [1, 3, 99999], 'patch': {'age': 50}},
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['updated_ids'], [1, 3])
+        self.assertEqual(data['not_found_ids'], [99999])
+
+        with self.app.app_context():
+            self.assertEqual(Actor.query.get(3).age, 50)
+
+    def test_422_unprocessable_update_actors_in_bulk(self):
+        res = self.client().patch(
+            '/actors/bulk',
+            json={'ids': [1], 'patch': {'gender': 'Unknown'}},
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_delete_actors_in_bulk(self):
+        res = self.client().post(
+            '/actors/bulk',
+            json=[self.actor_test, self.actor_test],
+            headers=self.default_token_auth)
+        created_ids = [
+            result['id']
+            for result in json.loads(res.data.decode('utf-8'))['results']]
+
+        res = self.client().delete(
+            '/actors/bulk',
+            json={'ids': created_ids + [99999]},
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted_ids'], sorted(created_ids))
+        self.assertEqual(data['not_found_ids'], [99999])
+
     def test_404_not_found_actor_to_delete(self):
         res = self.client().delete(
             '/actors/99999',
@@ -221,6 +531,51 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['movies']))
 
+    def test_get_paginated_list_of_movies_descending(self):
+        movies = self.get_all_pages(
+            '/movies?limit=2&sort=-release_year', 'movies')
+
+        with self.app.app_context():
+            self.assertEqual(len(movies), Movie.query.count())
+
+        self.assertEqual(
+            [(movie['release_year'], movie['id']) for movie in movies],
+            sorted(
+                ((movie['release_year'], movie['id']) for movie in movies),
+                reverse=True))
+
+    def test_stream_list_of_movies(self):
+        res = self.client().get(
+            '/movies?stream=1',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        with self.app.app_context():
+            self.assertEqual(len(data['movies']), Movie.query.count())
+
+    def test_get_filtered_list_of_movies(self):
+        res = self.client().get(
+            '/movies?release_year_from=2000&release_year_to=2010&limit=500',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['movies']))
+        for movie in data['movies']:
+            self.assertTrue(2000 <= movie['release_year'] <= 2010)
+
+    def test_movie_filters_use_index(self):
+        url = '/movies?release_year_from=2000&release_year_to=2010'
+        with self.app.test_request_context(url):
+            query = apply_filters(
+                project(Movie, Movie.FIELDS), MOVIE_FILTERS, request.args)
+            plan = self.explain(query)
+
+        self.assertIn('ix_Movie_release_year_id', plan)
+
     def test_get_movie_information(self):
         res = self.client().get(
             '/movies/1',
@@ -231,6 +586,33 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['movie'])
 
+    def test_get_movie_information_sparse_fields(self):
+        res = self.client().get(
+            '/movies/1?fields=release_year',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['movie']), {'id', 'release_year'})
+
+    def test_304_not_modified_movie_information(self):
+        res = self.client().get(
+            '/movies/1',
+            headers=self.default_token_auth)
+        etag = res.headers['ETag']
+
+        res = self.client().get(
+            '/movies/1',
+            headers={**self.default_token_auth, 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+
+        res = self.client().get(
+            '/movies/1?fields=title',
+            headers={**self.default_token_auth, 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+
     def test_404_movie_not_found(self):
         res = self.client().get(
             '/movies/99999',
@@ -265,6 +647,18 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Bad Request')
 
+    def test_create_movies_in_bulk(self):
+        res = self.client().post(
+            '/movies/bulk',
+            json=[self.movie_test, self.movie_with_wrong_attributes],
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created_count'], 1)
+        self.assertTrue(data['results'][0]['id'])
+        self.assertEqual(data['results'][1]['error'], 422)
+
     # Patch Movie
 
     def test_update_movie_information(self):
@@ -302,6 +696,25 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['deleted_id'])
 
+    def test_delete_movies_in_bulk(self):
+        res = self.client().delete(
+            '/movies/bulk',
+            json={'ids': [99998, 99999]},
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted_ids'], [])
+        self.assertEqual(data['not_found_ids'], [99998, 99999])
+
+    def test_403_forbidden_casting_assistant_update_movies_in_bulk(self):
+        res = self.client().patch(
+            '/movies/bulk',
+            json={'ids': [1], 'patch': {'title': 'Titanic'}},
+            headers=self.token_auth['casting_assistant_auth'])
+
+        self.assertEqual(res.status_code, 403)
+
     def test_404_not_found_movie_to_delete(self):
         res = self.client().delete(
             '/movies/99999',
@@ -392,6 +805,1256 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['deleted_id'])
 
+    '''
+    Cast Endpoint Tests
+    '''
+
+    def create_records(self, path, records):
+        res = self.client().post(
+            path, json=records, headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+        return [result['id'] for result in data['results']]
+
+    def get_json(self, path, headers=None):
+        res = self.client().get(
+            path, headers=headers or self.default_token_auth)
+        return res, json.loads(res.data.decode('utf-8') or '{}')
+
+    def test_movie_cast(self):
+        movie_id, = self.create_records(
+            '/movies/bulk', [{'title': 'Cast Movie', 'release_year': 2001}])
+        actor_ids = self.create_records('/actors/bulk', [
+            {'name': 'Cast Actor A', 'age': 30, 'gender': 'Female'},
+            {'name': 'Cast Actor B', 'age': 40, 'gender': 'Male'}])
+
+        res = self.client().post(
+            f'/movies/{movie_id}/actors',
+            json={'ids': actor_ids + [actor_ids[0], 2147483647]},
+            headers=self.token_auth['casting_director_auth'])
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['added_ids'], actor_ids)
+        self.assertEqual(data['not_found_ids'], [2147483647])
+
+        res = self.client().post(
+            f'/movies/{movie_id}/actors', json={'ids': actor_ids},
+            headers=self.default_token_auth)
+        self.assertEqual(json.loads(res.data)['added_ids'], [])
+
+        res, data = self.get_json(f'/movies/{movie_id}/actors')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [actor['name'] for actor in data['actors']],
+            ['Cast Actor A', 'Cast Actor B'])
+
+        res, data = self.get_json(f'/actors/{actor_ids[1]}/movies')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movies'], [
+            {'id': movie_id, 'title': 'Cast Movie', 'release_year': 2001}])
+
+        res = self.client().delete(
+            f'/movies/{movie_id}/actors/{actor_ids[0]}',
+            headers=self.default_token_auth)
+        self.assertEqual(res.status_code, 200)
+        res = self.client().delete(
+            f'/movies/{movie_id}/actors/{actor_ids[0]}',
+            headers=self.default_token_auth)
+        self.assertEqual(res.status_code, 404)
+
+        # Deleting an actor removes them from every cast
+        self.client().delete(
+            f'/actors/{actor_ids[1]}', headers=self.default_token_auth)
+        _, data = self.get_json(f'/movies/{movie_id}/actors')
+        self.assertEqual(data['actors'], [])
+
+    def test_404_cast_of_missing_records(self):
+        for path in ['/movies/2147483647/actors', '/actors/2147483647/movies']:
+            res, data = self.get_json(path)
+
+            self.assertEqual(res.status_code, 404)
+            self.assertEqual(data['success'], False)
+
+        res = self.client().post(
+            '/movies/2147483647/actors', json={'ids': [1]},
+            headers=self.default_token_auth)
+        self.assertEqual(res.status_code, 404)
+
+    def test_403_forbidden_casting_assistant_add_movie_actors(self):
+        res = self.client().post(
+            '/movies/1/actors', json={'ids': [1]},
+            headers=self.token_auth['casting_assistant_auth'])
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['success'], False)
+
+    def test_include_casts_in_constant_queries(self):
+        movie_ids = self.create_records('/movies/bulk', [
+            {'title': f'Included Movie {i}', 'release_year': 2000}
+            for i in range(60)])
+        actor_ids = self.create_records('/actors/bulk', [
+            {'name': f'Included Actor {i}', 'age': 30, 'gender': 'Male'}
+            for i in range(2)])
+
+        with self.app.app_context():
+            for movie_id in movie_ids:
+                add_cast(movie_id, actor_ids)
+
+        counts = []
+        for limit in [10, 500]:
+            with count_queries() as query_log:
+                res, data = self.get_json(
+                    f'/movies?limit={limit}&include=actors')
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(query_log.repeated(), {})
+            counts.append(query_log.count)
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], self.app.view_functions[
+            'retrieve_movies_list'].query_budget)
+
+        casts = {movie['id']: movie['actors'] for movie in data['movies']}
+        for movie_id in movie_ids:
+            self.assertEqual(
+                [actor['id'] for actor in casts[movie_id]], actor_ids)
+
+        _, data = self.get_json('/actors?limit=500&include=movies')
+        actors = {actor['id']: actor for actor in data['actors']}
+        self.assertEqual(
+            [movie['id'] for movie in actors[actor_ids[0]]['movies']],
+            movie_ids)
+
+    def test_casts_change_etag_of_included_lists_only(self):
+        movie_id, = self.create_records(
+            '/movies/bulk', [{'title': 'ETag Movie', 'release_year': 2001}])
+        actor_ids = self.create_records(
+            '/actors/bulk', [{'name': 'ETag Actor', 'age': 30,
+                              'gender': 'Male'}])
+
+        def etag(path):
+            return self.get_json(path)[0].get_etag()[0]
+
+        movie_etag = etag('/movies')
+        cast_etag = etag('/movies?include=actors')
+
+        with self.app.app_context():
+            add_cast(movie_id, actor_ids)
+
+        self.assertEqual(etag('/movies'), movie_etag)
+        self.assertNotEqual(etag('/movies?include=actors'), cast_etag)
+
+    def test_400_invalid_include(self):
+        for path in [
+            '/movies?include=directors', '/actors?include=actors',
+            '/movies?include=actors&stream=1'
+        ]:
+            res, data = self.get_json(path)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    '''
+    Stats Endpoint Tests
+    '''
+
+    def test_get_stats(self):
+        self.create_records('/actors/bulk', [
+            {'name': 'Stats Actor A', 'age': 21, 'gender': 'Female'},
+            {'name': 'Stats Actor B', 'age': 29, 'gender': 'Female'}])
+
+        res, data = self.get_json('/stats')
+        actors = data['actors']
+        by_age = {row['age']: row['count'] for row in actors['by_age']}
+        by_gender = {
+            row['gender']: row['count'] for row in actors['by_gender']}
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['refreshed_at'], None)
+        self.assertEqual(actors['count'], Actor.query.count())
+        self.assertEqual(sum(by_gender.values()), actors['count'])
+        self.assertEqual(by_gender['Female'], Actor.query.filter(
+            Actor.gender == 'Female').count())
+        self.assertEqual(by_age[20], Actor.query.filter(
+            Actor.age >= 20, Actor.age < 30).count())
+        self.assertEqual(
+            [row['age'] for row in actors['by_age']], sorted(by_age))
+        self.assertEqual(data['movies']['count'], Movie.query.count())
+        self.assertIn(
+            {'release_year': 1997, 'count': Movie.query.filter(
+                Movie.release_year == 1997).count()},
+            data['movies']['by_release_year'])
+
+    def test_stats_summary_is_refreshed_on_schedule(self):
+        refresh = self.app.test_cli_runner().invoke(args=['refresh-stats'])
+        self.assertEqual(refresh.exit_code, 0, refresh.output)
+
+        _, live = self.get_json('/stats')
+        self.app.extensions['stats_mode'] = 'summary'
+
+        res, data = self.get_json('/stats')
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(data['refreshed_at'])
+        self.assertEqual(data['actors'], live['actors'])
+        self.assertEqual(data['movies'], live['movies'])
+
+        self.create_records('/actors/bulk', [
+            {'name': 'Stats Actor C', 'age': 35, 'gender': 'Male'}])
+        _, stale = self.get_json('/stats')
+        self.assertEqual(stale['actors']['count'], live['actors']['count'])
+
+        result = self.app.test_cli_runner().invoke(args=['refresh-stats'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        _, fresh = self.get_json('/stats')
+        self.assertEqual(
+            fresh['actors']['count'], live['actors']['count'] + 1)
+        self.assertGreater(fresh['refreshed_at'], data['refreshed_at'])
+
+    def test_403_stats_without_movies_permission(self):
+        res = self.client().get(
+            '/stats', headers=self.token_auth['casting_assistant_auth'])
+        self.assertEqual(res.status_code, 200)
+
+        with mock.patch('app.check_permissions', side_effect=AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)):
+            res = self.client().get('/stats', headers=self.default_token_auth)
+
+        self.assertEqual(res.status_code, 403)
+
+    '''
+    Import Endpoint Tests
+    '''
+
+    def test_import_csv(self):
+        count = Actor.query.count()
+        body = (
+            'name,age,gender\n'
+            'Imported Actor A,31,Female\n'
+            'Imported Actor B,abc,Male\n'
+            '"Imported Actor, C",52,Male\n'
+            'Imported Actor D,40,Other\n')
+
+        res = self.client().post(
+            '/import/actors', data=body, content_type='text/csv',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported_count'], 2)
+        self.assertEqual(data['invalid_count'], 2)
+        self.assertEqual(
+            [(error['line'], error['error']) for error in data['errors']],
+            [(3, 400), (5, 422)])
+        self.assertEqual(Actor.query.count(), count + 2)
+        self.assertEqual(
+            [actor.format()['name'] for actor in Actor.query.order_by(
+                Actor.id.desc()).limit(2)],
+            ['Imported Actor, C', 'Imported Actor A'])
+
+    def test_import_ndjson(self):
+        count = Movie.query.count()
+        body = (
+            '{"title": "Imported Movie A", "release_year": 1999}\n'
+            '\n'
+            '{"title": "Imported Movie B", "release_year": "2001"}\n'
+            'not json\n'
+            '{"title": "", "release_year": 2001}\n')
+
+        res = self.client().post(
+            '/import/movies?format=ndjson', data=body,
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported_count'], 2)
+        self.assertEqual(
+            [(error['line'], error['error']) for error in data['errors']],
+            [(4, 400), (5, 422)])
+        self.assertEqual(Movie.query.count(), count + 2)
+
+    def test_import_reports_records_the_columns_reject(self):
+        body = (
+            '{"title": "%s", "release_year": 1999}\n'
+            '{"title": "Imported \\u0000 Movie", "release_year": 1999}\n'
+        ) % ('T' * 101)
+
+        res = self.client().post(
+            '/import/movies?format=ndjson', data=body,
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported_count'], 0)
+        self.assertEqual(
+            [error['description'] for error in data['errors']],
+            ['Title must be at most 100 characters.',
+             'Title must not contain NUL characters.'])
+
+    def test_import_command(self):
+        count = Actor.query.count()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'actors.ndjson')
+            errors_path = os.path.join(directory, 'errors.ndjson')
+            with open(path, 'w') as import_file:
+                import_file.write(
+                    '{"name": "CLI Actor", "age": 30, "gender": "Male"}\n'
+                    '{"name": "CLI Actor", "age": -1, "gender": "Male"}\n')
+
+            result = self.app.test_cli_runner().invoke(
+                args=['import', 'actors', path, '--errors', errors_path])
+            with open(errors_path) as errors_file:
+                errors = [json.loads(line) for line in errors_file]
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 1 actors', result.output)
+        self.assertEqual(Actor.query.count(), count + 1)
+        self.assertEqual(errors, [{
+            'line': 2, 'error': 422,
+            'description': 'Age must be at least 1.',
+            'record': {'name': 'CLI Actor', 'age': -1, 'gender': 'Male'}
+        }])
+
+    def test_400_invalid_import(self):
+        for path, body, content_type in [
+            ('/import/actors', 'name,age\n', 'application/json'),
+            ('/import/movies?format=xml', '', 'text/csv'),
+            ('/import/actors', b'name,age,gender\n\xff,1,Male\n', 'text/csv')
+        ]:
+            res = self.client().post(
+                path, data=body, content_type=content_type,
+                headers=self.default_token_auth)
+
+            self.assertEqual(res.status_code, 400)
+
+    def test_403_import_as_assistant(self):
+        res = self.client().post(
+            '/import/actors', data='name,age,gender\n',
+            content_type='text/csv',
+            headers=self.token_auth['casting_assistant_auth'])
+
+        self.assertEqual(res.status_code, 403)
+
+    '''
+    Export Endpoint Tests
+    '''
+
+    def test_export_ndjson(self):
+        res = self.client().get(
+            '/export/actors', headers=self.default_token_auth)
+        lines = res.data.decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [actor.format() for actor in Actor.query.order_by(Actor.id)])
+
+    def test_export_csv_since(self):
+        since = Movie.query.order_by(Movie.id).first().id
+        res = self.client().get(
+            f'/export/movies?format=csv&since={since}',
+            headers=self.default_token_auth)
+        rows = list(csv.reader(res.data.decode('utf-8').splitlines()))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(rows[0], ['id', 'title', 'release_year'])
+        self.assertEqual(rows[1:], [
+            [str(movie.id), movie.title, str(movie.release_year)]
+            for movie in Movie.query.filter(
+                Movie.id > since).order_by(Movie.id)
+        ])
+
+    def test_400_invalid_export(self):
+        for path in [
+            '/export/actors?format=xml', '/export/movies?since=last',
+            '/export/actors?since=2147483648'
+        ]:
+            res, data = self.get_json(path)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    '''
+    Search Endpoint Tests
+    '''
+
+    def test_search_actors_and_movies(self):
+        res = self.client().get(
+            '/search?q=Winslet',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['actors']))
+        self.assertEqual(data['actors'][0]['name'], 'Kate Winslet')
+        self.assertEqual(data['movies'], [])
+
+    def test_search_finds_updated_names(self):
+        res = self.client().post(
+            '/movies',
+            json={'title': 'Placeholder', 'release_year': 2020},
+            headers=self.default_token_auth)
+        movie_id = json.loads(res.data.decode('utf-8'))['created_id']
+
+        self.client().patch(
+            f'/movies/{movie_id}',
+            json={'title': 'Searchable Title'},
+            headers=self.default_token_auth)
+
+        res = self.client().get(
+            '/search?q=searchable&type=movies',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('actors', data)
+        self.assertEqual(data['movies'][0]['id'], movie_id)
+
+    def test_422_unprocessable_search_text_too_short(self):
+        res = self.client().get(
+            '/search?q=ab',
+            headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    '''
+    Compression Tests
+    '''
+
+    def test_compressed_list_of_actors(self):
+        self.app.extensions['compression'].min_size = 0
+        plain = self.client().get(
+            '/actors',
+            headers=self.default_token_auth)
+        res = self.client().get(
+            '/actors',
+            headers={**self.default_token_auth, 'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        self.assertEqual(res.headers['ETag'], 'W/' + plain.headers['ETag'])
+
+        res = self.client().get(
+            '/actors',
+            headers={
+                **self.default_token_auth,
+                'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    def test_compressed_stream_of_actors(self):
+        res = self.client().get(
+            '/actors?stream=true',
+            headers={**self.default_token_auth, 'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data).decode('utf-8'))
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['actors']))
+
+    def test_small_responses_are_not_compressed(self):
+        res = self.client().get('/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    '''
+    Response Cache Tests
+    '''
+
+    def test_cached_list_is_invalidated_by_writes(self):
+        setup_response_cache(self.app, 'lru')
+        cache = self.app.extensions['response_cache']
+
+        first = self.client().get(
+            '/actors?limit=500', headers=self.default_token_auth)
+        second = self.client().get(
+            '/actors?limit=500', headers=self.default_token_auth)
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(cache.stats()['size'], 1)
+
+        self.client().patch(
+            '/actors/1',
+            json={'name': 'Cached Name'},
+            headers=self.default_token_auth)
+        res = self.client().get(
+            '/actors?limit=500', headers=self.default_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertIn('Cached Name', [actor['name'] for actor in data['actors']])
+        self.assertEqual(cache.stats()['size'], 2)
+
+    '''
+    Internal Endpoint Tests
+    '''
+
+    internal_token_auth = {'Authorization': 'Bearer internal-test-token'}
+
+    @mock.patch('auth.auth.INTERNAL_API_TOKEN', 'internal-test-token')
+    def test_get_connection_pool_status(self):
+        res = self.client().get(
+            '/internal/pool', headers=self.internal_token_auth)
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['pool']['class'])
+
+    @mock.patch('auth.auth.INTERNAL_API_TOKEN', 'internal-test-token')
+    def test_get_metrics(self):
+        self.client().get('/actors', headers=self.default_token_auth)
+        res = self.client().get('/metrics', headers=self.internal_token_auth)
+        text = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn(
+            'http_responses_total{endpoint="/actors",method="GET",'
+            'status="200"}', text)
+        for phase in ['query', 'serialization']:
+            self.assertIn(
+                'http_request_phase_seconds_count{endpoint="/actors",'
+                f'phase="{phase}"}}', text)
+
+    def test_404_internal_endpoints_without_configured_token(self):
+        for path in ['/internal/pool', '/internal/cache', '/metrics']:
+            res = self.client().get(path, headers=self.internal_token_auth)
+
+            self.assertEqual(res.status_code, 404)
+
+    @mock.patch('auth.auth.INTERNAL_API_TOKEN', 'internal-test-token')
+    def test_401_internal_endpoints_with_wrong_token(self):
+        for headers in [{}, self.default_token_auth]:
+            for path in ['/internal/pool', '/internal/cache', '/metrics']:
+                res = self.client().get(path, headers=headers)
+                data = json.loads(res.data.decode('utf-8'))
+
+                self.assertEqual(res.status_code, 401)
+                self.assertEqual(data['success'], False)
+
+    '''
+    Query Budget Tests
+    '''
+
+    def assert_within_query_budget(self, method, path, body=None):
+        with count_queries() as query_log:
+            res = getattr(self.client(), method)(
+                path, json=body, headers=self.default_token_auth)
+            res.get_data()
+
+        endpoint, _ = self.app.url_map.bind('localhost').match(
+            path.split('?')[0], method.upper())
+        budget = self.app.view_functions[endpoint].query_budget
+
+        self.assertEqual(res.status_code, 200, f'{method} {path}')
+        self.assertLessEqual(query_log.count, budget, f'{method} {path}')
+        self.assertEqual(query_log.repeated(), {})
+
+        return res.get_json()
+
+    def test_routes_stay_within_query_budget(self):
+        actor_id = self.assert_within_query_budget(
+            'post', '/actors', self.actor_test)['created_id']
+        movie_id = self.assert_within_query_budget(
+            'post', '/movies', self.movie_test)['created_id']
+
+        for path in [
+            '/actors?limit=500', '/actors?sort=-age&fields=name,age',
+            f'/actors/{actor_id}', '/movies?limit=500',
+            f'/movies/{movie_id}', '/search?q=Will',
+            '/actors?include=movies', '/movies?limit=500&include=actors',
+            f'/actors/{actor_id}/movies', f'/movies/{movie_id}/actors',
+            '/stats', '/export/actors', '/export/movies?format=csv'
+        ]:
+            self.assert_within_query_budget('get', path)
+
+        self.app.test_cli_runner().invoke(args=['refresh-stats'])
+        self.app.extensions['stats_mode'] = 'summary'
+        self.assert_within_query_budget('get', '/stats')
+
+        self.assert_within_query_budget(
+            'patch', f'/actors/{actor_id}', {'age': 54})
+        self.assert_within_query_budget(
+            'patch', f'/movies/{movie_id}', {'release_year': 2021})
+        self.assert_within_query_budget('delete', f'/actors/{actor_id}')
+        self.assert_within_query_budget('delete', f'/movies/{movie_id}')
+
+    def test_repeated_and_slow_queries_are_logged(self):
+        query_log = QueryLog()
+        statement = 'SELECT name FROM "Actor" WHERE id = ?'
+
+        with mock.patch('metrics.queries.SLOW_QUERY_SECONDS', 0.1):
+            with self.assertLogs('metrics.queries', 'WARNING') as logs:
+                for actor_id in range(5):
+                    query_log.record(statement, (actor_id,), 0.001)
+                query_log.record(
+                    'INSERT INTO "Actor" (name) VALUES (?)',
+                    [('A',), ('B',)], 0.2, executemany=True)
+
+        self.assertEqual(query_log.count, 6)
+        self.assertEqual(query_log.slow, 1)
+        self.assertEqual(query_log.repeated(), {statement: 5})
+        self.assertIn('parameters=2 x (str)', logs.output[0])
+        self.assertEqual(
+            parameters_shape({'id': 1, 'name': 'A'}),
+            "{'id': int, 'name': str}")
+
+    '''
+    Authentication Tests
+    '''
+
+    def test_400_malformed_token(self):
+        res = self.client().get(
+            '/actors',
+            headers={'Authorization': 'Bearer not-a-jwt'})
+        data = json.loads(res.data.decode('utf-8'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['code'], 'invalid_header')
+
+
+class ReadReplicaTestCase(unittest.TestCase):
+    """This class represents the read replica routing test cases"""
+
+    def setUp(self):
+        self.replica_file = tempfile.NamedTemporaryFile(suffix='.db')
+        replica_url = 'sqlite:///' + self.replica_file.name
+
+        engine = sqlalchemy.create_engine(replica_url)
+        db.Model.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Actor.__table__.insert().values(
+                name='Replica Actor', age=30, gender='Female'))
+        engine.dispose()
+
+        self.replica_url = replica_url
+        self.apps = []
+        self.app = self.create_app(replica_url)
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            db.create_all()
+        self.director_auth = {
+            'Authorization': 'Bearer '
+            + os.environ['CASTING_DIRECTOR_TOKEN']}
+        self.producer_auth = {
+            'Authorization': 'Bearer '
+            + os.environ['EXECUTIVE_PRODUCER_TOKEN']}
+
+    def tearDown(self):
+        for worker in self.apps:
+            worker.extensions['replicas'].dispose()
+        self.replica_file.close()
+
+    def create_app(self, replica_url):
+        os.environ['DATABASE_REPLICA_URLS'] = replica_url
+        try:
+            worker = app.create_app()
+        finally:
+            del os.environ['DATABASE_REPLICA_URLS']
+
+        self.apps.append(worker)
+        return worker
+
+    def get_actor_names(self, headers, client=None):
+        client = client or self.client()
+        res = client.get('/actors?limit=500', headers=headers)
+        data = json.loads(res.data.decode('utf-8'))
+        return [actor['name'] for actor in data['actors']]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(
+            self.get_actor_names(self.producer_auth), ['Replica Actor'])
+
+    def test_writes_go_to_primary_and_pin_reads(self):
+        res = self.client().post(
+            '/actors',
+            json={'name': 'Primary Actor', 'age': 40, 'gender': 'Male'},
+            headers=self.director_auth)
+        self.assertEqual(res.status_code, 200)
+
+        self.assertIn(
+            'Primary Actor', self.get_actor_names(self.director_auth))
+        self.assertEqual(
+            self.get_actor_names(self.producer_auth), ['Replica Actor'])
+
+    def test_failing_replica_is_ejected(self):
+        replicas = self.app.extensions['replicas']
+        replicas.eject(replicas.engines[0])
+
+        self.assertNotIn(
+            'Replica Actor', self.get_actor_names(self.producer_auth))
+
+    def test_pin_cookie_pins_reads_in_other_workers(self):
+        res = self.client().post(
+            '/actors',
+            json={'name': 'Cookie Actor', 'age': 40, 'gender': 'Male'},
+            headers=self.director_auth)
+        name, value = res.headers['Set-Cookie'].split(';')[0].split('=', 1)
+
+        other_worker = self.create_app(self.replica_url).test_client()
+
+        self.assertEqual(
+            self.get_actor_names(self.director_auth, other_worker),
+            ['Replica Actor'])
+
+        other_worker.set_cookie('localhost', name, value)
+        self.assertIn('Cookie Actor', self.get_actor_names(
+            self.director_auth, other_worker))
+        # The cookie only pins the client that wrote
+        self.assertEqual(
+            self.get_actor_names(self.producer_auth, other_worker),
+            ['Replica Actor'])
+
+    def test_failed_replica_read_is_retried_on_primary(self):
+        worker = self.create_app('sqlite:////nonexistent/replica.db')
+        replicas = worker.extensions['replicas']
+
+        names = self.get_actor_names(
+            self.producer_auth, worker.test_client())
+
+        self.assertNotIn('Replica Actor', names)
+        self.assertIsNone(replicas.choose())
+
+    def test_pins_are_thread_safe(self):
+        pins = PrimaryPins(seconds=0, max_size=10)
+        errors = []
+
+        def pin_many(thread):
+            try:
+                for i in range(2000):
+                    pins.pin(f'{thread}-{i}')
+            except RuntimeError as error:
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=pin_many, args=(thread,))
+            for thread in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test cases"""
+
+    def setUp(self):
+        self.jwks = {'keys': [
+            {'kty': 'RSA', 'kid': 'key-1', 'use': 'sig', 'n': 'n1', 'e': 'AQAB'}
+        ]}
+        self.fetch_count = 0
+
+    def fetch(self, url, timeout=5):
+        self.fetch_count += 1
+        return self.jwks
+
+    def test_keys_are_cached_by_kid(self):
+        store = JWKSKeyStore('file:///jwks.json', fetch=self.fetch)
+
+        self.assertEqual(store.get_key('key-1')['n'], 'n1')
+        self.assertEqual(store.get_key('key-1')['n'], 'n1')
+        self.assertEqual(self.fetch_count, 1)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        store = JWKSKeyStore(
+            'file:///jwks.json', refetch_interval=60, fetch=self.fetch)
+        store.get_key('key-1')
+
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertEqual(self.fetch_count, 1)
+
+        store._last_attempt -= 60
+        self.jwks['keys'].append(
+            {'kty': 'RSA', 'kid': 'key-2', 'use': 'sig', 'n': 'n2', 'e': 'AQAB'})
+
+        self.assertEqual(store.get_key('key-2')['n'], 'n2')
+        self.assertEqual(self.fetch_count, 2)
+
+    def test_stale_keys_are_served_when_refresh_fails(self):
+        store = JWKSKeyStore(
+            'file:///jwks.json', ttl=0, stale_ttl=3600, fetch=self.fetch)
+        store.get_key('key-1')
+
+        def failing_fetch(url, timeout=5):
+            raise OSError('JWKS endpoint is down')
+
+        store._fetch = failing_fetch
+        store._last_attempt -= 60
+
+        self.assertEqual(store.get_key('key-1')['n'], 'n1')
+
+    def test_keys_past_stale_limit_are_not_served(self):
+        store = JWKSKeyStore(
+            'file:///jwks.json', ttl=10, stale_ttl=10, fetch=self.fetch)
+        store.get_key('key-1')
+
+        def failing_fetch(url, timeout=5):
+            raise OSError('JWKS endpoint is down')
+
+        store._fetch = failing_fetch
+        store._fetched_at -= 60
+        store._last_attempt -= 60
+
+        with self.assertRaises(JWKSUnavailableError):
+            store.get_key('key-1')
+
+    def test_concurrent_cold_start_fetches_once(self):
+        def slow_failing_fetch(url, timeout=5):
+            self.fetch_count += 1
+            time.sleep(0.05)
+            raise OSError('JWKS endpoint is down')
+
+        store = JWKSKeyStore('file:///jwks.json', fetch=slow_failing_fetch)
+        errors = []
+
+        def get_key():
+            try:
+                store.get_key('key-1')
+            except JWKSUnavailableError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=get_key) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.fetch_count, 1)
+        self.assertEqual(len(errors), 8)
+
+    def test_unavailable_without_cached_keys(self):
+        def failing_fetch(url, timeout=5):
+            raise OSError('JWKS endpoint is down')
+
+        store = JWKSKeyStore('file:///jwks.json', fetch=failing_fetch)
+
+        with self.assertRaises(JWKSUnavailableError):
+            store.get_key('key-1')
+
+    def test_fetch_local_jwks_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as jwks_file:
+            json.dump(self.jwks, jwks_file)
+            jwks_file.flush()
+
+            jwks = fetch_jwks('file://' + jwks_file.name)
+
+        self.assertEqual(jwks['keys'][0]['kid'], 'key-1')
+
+
+class InstrumentedQueuePoolTestCase(unittest.TestCase):
+    """This class represents the connection pool statistics test cases"""
+
+    def test_checkouts_and_timeouts_are_recorded(self):
+        pool = InstrumentedQueuePool(
+            lambda: sqlite3.connect(':memory:'),
+            pool_size=1, max_overflow=0, timeout=0.01)
+
+        connection = pool.connect()
+        with self.assertRaises(sqlalchemy.exc.TimeoutError):
+            pool.connect()
+
+        status = pool_status(pool)
+        self.assertEqual(status['checked_out'], 1)
+        self.assertEqual(status['checkouts'], 1)
+        self.assertEqual(status['checkout_timeouts'], 1)
+        self.assertEqual(status['connects'], 1)
+        self.assertEqual(status['wait_seconds']['count'], 2)
+
+        connection.close()
+        self.assertEqual(pool_status(pool)['checked_out'], 0)
+
+
+class ValidationTestCase(unittest.TestCase):
+    """This class represents the compiled record validators"""
+
+    def test_types_are_checked_before_values(self):
+        self.assertEqual(
+            validate_actor({'name': '', 'age': -1}),
+            (None, (400, 'Gender is required.')))
+        self.assertEqual(
+            validate_actor({'name': '', 'age': -1, 'gender': 'Male'}),
+            (None, (422, 'Name must not be empty.')))
+        self.assertEqual(
+            validate_actor({'name': 'A', 'age': ' 7 ', 'gender': 'Female'}),
+            ({'name': 'A', 'age': 7, 'gender': 'Female'}, None))
+
+    def test_patches_skip_missing_fields(self):
+        self.assertEqual(
+            validate_actor_patch({'age': '30', 'gender': None}),
+            ({'age': 30}, None))
+        self.assertEqual(
+            validate_actor_patch({'gender': 'male'}),
+            (None, (422, 'Gender must be either Male or Female.')))
+
+    def test_records_are_validated_in_one_pass(self):
+        valid, invalid = validate_records(validate_actor, [
+            {'name': 'A', 'age': 30, 'gender': 'Male'},
+            'A',
+            {'name': 'B', 'age': 0, 'gender': 'Male'}])
+
+        self.assertEqual(
+            valid, [(0, {'name': 'A', 'age': 30, 'gender': 'Male'})])
+        self.assertEqual(invalid, [
+            (1, (400, 'Expected a JSON object.')),
+            (2, (422, 'Age must be at least 1.'))])
+
+    def test_strings_fit_their_columns(self):
+        self.assertEqual(
+            validate_movie({'title': 'T' * 101, 'release_year': 2000}),
+            (None, (422, 'Title must be at most 100 characters.')))
+        self.assertEqual(
+            validate_actor({'name': 'A\x00', 'age': 30, 'gender': 'Male'}),
+            (None, (422, 'Name must not contain NUL characters.')))
+        self.assertEqual(
+            validate_movie({'title': 'T' * 100, 'release_year': 2000}),
+            ({'title': 'T' * 100, 'release_year': 2000}, None))
+
+
+class FakeCopyConnection:
+    '''Stands for a psycopg2 connection answering COPY ... TO STDOUT'''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.connection = self
+        self.invalidated = False
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, statement, file):
+        for row in self.rows:
+            file.write(row)
+
+    def close(self):
+        pass
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+class FakeCopyInConnection:
+    '''Stands for a psycopg2 connection failing COPY ... FROM STDIN'''
+
+    def __init__(self):
+        self.dialect = postgresql.psycopg2.dialect(dbapi=psycopg2)
+        self.connection = self
+
+    def execute(self, statement):
+        pass
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, statement, file):
+        raise psycopg2.DataError('value too long for type varchar(100)')
+
+    def close(self):
+        pass
+
+
+class CopyLoaderTestCase(unittest.TestCase):
+    """This class represents the loading of imports with COPY"""
+
+    def test_copy_errors_are_sqlalchemy_errors(self):
+        loader = CopyLoader(FakeCopyInConnection(), Actor)
+
+        with self.assertRaises(sqlalchemy.exc.DataError):
+            loader.load([{'name': 'A' * 101, 'age': 30, 'gender': 'Male'}])
+
+
+class CopyToStdoutTestCase(unittest.TestCase):
+    """This class represents the streaming of COPY outputs"""
+
+    def test_output_is_chunked(self):
+        rows = [b'%d,actor\n' % i for i in range(1000)]
+        connection = FakeCopyConnection(rows)
+        chunks = list(copy_to_stdout(connection, 'COPY', chunk_size=1024))
+
+        self.assertEqual(b''.join(chunks), b''.join(rows))
+        self.assertTrue(all(len(chunk) < 1100 for chunk in chunks))
+        self.assertFalse(connection.invalidated)
+
+    def test_closed_export_stops_the_copy(self):
+        connection = FakeCopyConnection(b'row\n' for _ in range(10 ** 9))
+        chunks = copy_to_stdout(
+            connection, 'COPY', chunk_size=64, queue_size=2)
+
+        self.assertEqual(next(chunks), b'row\n' * 16)
+        chunks.close()
+
+        self.assertTrue(connection.invalidated)
+
+
+class JSONProviderTestCase(unittest.TestCase):
+    """This class represents the JSON provider test cases"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.context = self.app.test_request_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def assert_same_bytes(self, data):
+        expected = flask_jsonify(data).get_data()
+        for name in ['stdlib', 'orjson' if orjson else 'stdlib']:
+            setup_json_provider(self.app, name)
+            self.assertEqual(jsonify(data).get_data(), expected)
+
+    def test_providers_match_flask_jsonify(self):
+        self.assert_same_bytes({
+            'success': True,
+            'actors': [
+                {'id': i, 'name': f'Actor \"{i}\"\n', 'age': None,
+                 'gender': 'Female'}
+                for i in range(100)
+            ],
+            'ratio': 0.25
+        })
+
+    def test_non_ascii_and_unsupported_values_fall_back(self):
+        self.assert_same_bytes({'name': 'Penélope Cruz', 'id': 2 ** 70})
+
+
+class FakeMemcachedHandler(socketserver.StreamRequestHandler):
+    """Speaks the get and set commands of the memcached text protocol"""
+
+    def handle(self):
+        for line in self.rfile:
+            command = line.split()
+            if command[0] == b'get':
+                value = self.server.entries.get(command[1])
+                if value is not None:
+                    self.wfile.write(
+                        b'VALUE %s 0 %d\r\n%s\r\n'
+                        % (command[1], len(value), value))
+                self.wfile.write(b'END\r\n')
+            elif command[0] == b'set':
+                value = self.rfile.read(int(command[4]) + 2)[:-2]
+                self.server.entries[command[1]] = value
+                self.wfile.write(b'STORED\r\n')
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache backends test cases"""
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+
+        self.assertEqual(cache.get('a'), b'1')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_memcached_cache(self):
+        server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), FakeMemcachedHandler)
+        server.daemon_threads = True
+        server.entries = {}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            cache = MemcachedCache(
+                'memcached://127.0.0.1:%d' % server.server_address[1])
+            cache.set('key', b'application/json\n{"a":1}')
+
+            self.assertEqual(cache.get('key'), b'application/json\n{"a":1}')
+            self.assertIsNone(cache.get('missing'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_unavailable_memcached_is_a_miss(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        cache = MemcachedCache('memcached://127.0.0.1:%d' % port)
+        cache.set('key', b'value')
+        self.assertIsNone(cache.get('key'))
+
+        # the server is skipped until the retry interval has passed
+        self.assertGreater(cache._down_until, time.monotonic())
+        cache.address = None
+        self.assertIsNone(cache.get('key'))
+
+    def test_closed_memcached_connection_is_dropped(self):
+        server = socketserver.TCPServer(
+            ('127.0.0.1', 0), socketserver.BaseRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            cache = MemcachedCache(
+                'memcached://127.0.0.1:%d' % server.server_address[1])
+
+            self.assertIsNone(cache.get('key'))
+            self.assertIsNone(cache._local.connection)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    """This class represents the multi-process metrics test cases"""
+
+    def test_worker_snapshots_are_summed(self):
+        workers = [MetricsRegistry(), MetricsRegistry()]
+        labels = {'endpoint': '/actors', 'method': 'GET'}
+
+        for seconds, worker in zip([0.002, 0.2], workers):
+            worker.inc('http_requests_total', labels)
+            worker.observe('http_request_duration_seconds', labels, seconds)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, worker in enumerate(workers):
+                write_snapshot(directory, worker.snapshot(), name)
+            counters, histograms = merge_snapshots(read_snapshots(directory))
+
+        key = tuple(sorted(labels.items()))
+        self.assertEqual(counters[('http_requests_total', key)], 2)
+        buckets, total = histograms[('http_request_duration_seconds', key)]
+        self.assertEqual(sum(buckets), 2)
+        self.assertAlmostEqual(total, 0.202)
+
+        text = render_prometheus(counters, histograms)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{endpoint="/actors",'
+            'method="GET",le="0.0025"} 1', text)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{endpoint="/actors",'
+            'method="GET",le="+Inf"} 2', text)
+
+    def test_discarded_series_are_not_exported(self):
+        registry = MetricsRegistry()
+        registry.observe('app_startup_seconds', {'phase': 'create_app'}, 1.0)
+        registry.observe('app_startup_seconds', {'phase': 'first_request'}, 1)
+        registry.discard('app_startup_seconds', {'phase': 'create_app'})
+
+        self.assertEqual(
+            [labels for _, labels, _, _ in registry.snapshot()['histograms']],
+            [[('phase', 'first_request')]])
+
+    def test_exited_worker_snapshots_are_compacted(self):
+        labels = {'endpoint': '/actors', 'method': 'GET'}
+        key = ('http_requests_total', tuple(sorted(labels.items())))
+
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in [101, 102, 103]:
+                worker = MetricsRegistry()
+                worker.inc('http_requests_total', labels, pid)
+                write_snapshot(directory, worker.snapshot(), f'{pid}_1')
+
+            compact_snapshots(directory, is_alive=lambda pid: pid == 103)
+            compact_snapshots(directory, is_alive=lambda pid: pid == 103)
+
+            self.assertEqual(
+                sorted(name for name in os.listdir(directory)
+                       if name.endswith('.json')),
+                ['metrics_103_1.json', 'metrics_exited.json'])
+            counters, _ = merge_snapshots(read_snapshots(directory))
+            self.assertEqual(counters[key], 306)
+
+            compact_snapshots(directory, is_alive=lambda pid: False)
+            counters, _ = merge_snapshots(read_snapshots(directory))
+            self.assertEqual(counters[key], 306)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test cases"""
+
+    def setUp(self):
+        self.verify_count = 0
+        self.payload = {
+            'sub': 'tester',
+            'exp': time.time() + 3600,
+            'permissions': ['get:actors']
+        }
+
+    def verify(self, token):
+        self.verify_count += 1
+        if token == 'bad-token':
+            raise AuthError({'code': 'invalid_header'}, 400)
+        return self.payload
+
+    def test_verified_payload_is_cached(self):
+        cache = TokenCache()
+        cache.get_or_verify('token', self.verify)
+        payload, permissions = cache.get_or_verify('token', self.verify)
+
+        self.assertEqual(payload['sub'], 'tester')
+        self.assertEqual(permissions, frozenset(['get:actors']))
+        self.assertEqual(self.verify_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_expire_at_token_exp(self):
+        self.payload['exp'] = time.time() - 1
+        cache = TokenCache()
+        cache.get_or_verify('token', self.verify)
+        cache.get_or_verify('token', self.verify)
+
+        self.assertEqual(self.verify_count, 2)
+
+    def test_failed_tokens_are_negative_cached(self):
+        cache = TokenCache()
+
+        for _ in range(3):
+            with self.assertRaises(AuthError):
+                cache.get_or_verify('bad-token', self.verify)
+
+        self.assertEqual(self.verify_count, 1)
+        self.assertEqual(cache.stats()['negative_hits'], 2)
+
+    def test_negative_hits_raise_new_errors(self):
+        results = []
+        cache = TokenCache(record=results.append)
+        errors = []
+
+        for _ in range(3):
+            try:
+                cache.get_or_verify('bad-token', self.verify)
+            except AuthError as error:
+                errors.append(error)
+
+        self.assertIsNot(errors[1], errors[2])
+        self.assertEqual(errors[2].status_code, 400)
+        self.assertEqual(errors[2].error['code'], 'invalid_header')
+        self.assertEqual(len(traceback.extract_tb(errors[2].__traceback__)), 2)
+        self.assertEqual(results, ['miss', 'negative_hit', 'negative_hit'])
+
+    def test_cache_is_bounded(self):
+        cache = TokenCache(max_size=2)
+
+        for token in ['token-1', 'token-2', 'token-3']:
+            cache.get_or_verify(token, self.verify)
+        cache.get_or_verify('token-1', self.verify)
+
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(self.verify_count, 4)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":